@@ -19,6 +19,9 @@ def main() -> int:
         elif options.LIST_PAGES:
                 commands.list_saved_pages()
                 return 0
+        elif options.CACHE_STATS:
+                commands.list_cache_stats()
+                return 0
 
         command = options.POSITIONAL_ARGS[0]
         language = options.POSITIONAL_ARGS[1]
@@ -33,6 +36,10 @@ def main() -> int:
 
         if options.DO_SEARCH:
                 commands.search_wiki(word, language, site)
+        elif options.BULK:
+                commands.fetch_wiki_pages(word, language, site)
+        elif options.IMPORT:
+                commands.import_dump(word, language, site, path)
         else:
                 commands.fetch_wiki_page(word, language, path, site)
 
@@ -1,31 +1,248 @@
 from tools.wikiparser import *
 from tools import languages
 from tools import options
+from tools import config
 from tools.logger import log
+import sys
+import threading
+from collections import Counter
 
 from services.wiki_api import WikiApi
+from services.fetcher import Fetcher
+from services.importer import DumpStats, read_dump
 from services.db import Database
 
 from ui import cli_ui
 
-def _get_page_from_wiki(page_name: str, lang: str, site: str) -> WikiPage | None:
+def _get_page_from_wiki(page_name: str, lang: str, site: str, db: Database=None) -> WikiPage | None:
         """Get a page and create a WikiPage object from it.
-        If unable to get the page, returns None.
+        If unable to get the page, returns None. If the page doesn't exist, saves the search into db as a failed search.
         """
         wiki = WikiApi(lang, site)
         page_info = wiki.get_page(page_name)
 
         if not page_info:
+                if db and wiki.last_error == "missingtitle":
+                        db.save_failed_search(page_name, lang, site)
                 return None
 
         page_title = page_info[0]
-        _page_id = page_info[1]
-        page_text = page_info[2]
+        page_id = page_info[1]
+        rev_id = page_info[2]
+        page_text = page_info[3]
 
-        page = WikiPage(page_text, page_title, lang, site)
+        page = WikiPage(page_text, page_title, lang, site, lazy=True, page_id=page_id, rev_id=rev_id)
 
         return page
 
+def _revalidate_saved_page(db: Database, page_name: str, lang: str, site: str) -> WikiPage | None:
+        """Check if an expired saved page has changed on the wiki since it was saved.
+        If not, marks the saved page up to date and returns it. Otherwise returns None.
+        """
+        saved_page = db.load_page(page_name, lang, site, include_expired=True)
+        if not saved_page or saved_page.rev_id is None:
+                return None
+
+        latest = WikiApi(lang, site).get_revision_ids([page_name]).get(page_name)
+        if not latest or latest[2] != saved_page.rev_id:
+                return None
+
+        log(f"Saved page {saved_page.title} is up to date.")
+        db.touch_pages([saved_page.title], lang, site)
+        return saved_page
+
+def _refresh_saved_page(page_name: str, lang: str, site: str) -> None:
+        """Bring an expired saved page up to date: mark it up to date if it hasn't changed on the wiki, otherwise get and save it again.
+        Meant to be run in its own thread, so it uses its own database connection.
+        """
+        try:
+                db = Database()
+                if _revalidate_saved_page(db, page_name, lang, site):
+                        return
+                page = _get_page_from_wiki(page_name, lang, site, db)
+                if page:
+                        log(f"Saving refreshed page {page.title}")
+                        db.save_page(page)
+                        db.save_aliases({ page_name : page.title }, lang, site)
+        except Exception as e:
+                # the page has already been printed, so this shouldn't interrupt the user
+                log(f"Refreshing saved page \"{page_name}\" failed:", e)
+
+# Templates linking to other pages, and the position of the linked page's title among their positional params.
+# The first positional param is the language code.
+_LINK_TEMPLATES = {
+        "l": 1, "l-self": 1, "ll": 1, "link": 1, "m": 1, "mention": 1,
+        "inflection of": 1, "infl of": 1, "plural of": 1, "alternative form of": 1, "alt form": 1, "synonym of": 1,
+}
+
+def _linked_titles(page: WikiPage, sections: list[Section], limit: int) -> list[str]:
+        """Titles of the pages that sections link to with [[links]] and link templates like {{l|...}} and {{inflection of|...}},
+        most linked first. At most limit titles are returned, not including the page itself.
+        """
+        titles = Counter()
+        for sect in sections:
+                for link in sect.tree.all_links():
+                        titles[link.target] += 1
+                for template in sect.tree.templates_named(*_LINK_TEMPLATES):
+                        position = _LINK_TEMPLATES[template.name]
+                        params = template.positional_params()
+                        if len(params) <= position or params[0].strip() != page.language:
+                                continue
+                        titles[params[position]] += 1
+
+        linked = []
+        for title, _ in titles.most_common():
+                title = title.split("#")[0].strip()
+                # skip links to other namespaces and wikis, e.g. [[Category:...]] and [[w:...]]
+                if not title or ":" in title or title == page.title or title in linked:
+                        continue
+                linked.append(title)
+                if len(linked) == limit:
+                        break
+        return linked
+
+def _prefetch_pages(titles: list[str], lang: str, site: str) -> None:
+        """Get and save the pages for titles that aren't saved yet, in one batched request per WIKI_QUERY_TITLES_LIMIT titles.
+        Meant to be run in its own thread, so it uses its own database connection.
+        """
+        try:
+                db = Database()
+                saved = db.get_page_revisions(titles, lang, site)
+                titles = [t for t in titles if (t not in saved or saved[t][1]) and not db.is_failed_search(t, lang, site)]
+                if not titles:
+                        return
+
+                log(f"Prefetching {len(titles)} linked pages from {site}.")
+                pages = []
+                aliases = {}
+                for title, page in WikiApi(lang, site).get_pages(titles):
+                        if page:
+                                pages.append(page)
+                                aliases[title] = page.title
+                        else:
+                                db.save_failed_search(title, lang, site)
+                db.save_pages(pages)
+                db.save_aliases(aliases, lang, site)
+        except Exception as e:
+                # the page has already been printed, so this shouldn't interrupt the user
+                log("Prefetching linked pages failed:", e)
+
+def _print_page(page: WikiPage, path: str | None) -> None:
+        """Print the sections of page that path points to.
+        If prefetching is on, the pages that the printed sections link to are then got and saved in the background.
+        """
+        cli_ui.print_sections(page, path)
+
+        if not (options.PREFETCH or config.WIKI_PREFETCH_LINKS) or not path or (path.endswith(config.PATH_SEP) and len(path) > 1):
+                # nothing or only section structures were printed
+                return
+        titles = _linked_titles(page, page.find_page_sections(path), config.WIKI_PREFETCH_PAGES)
+        if titles:
+                # not a daemon thread, so the prefetch finishes before the program exits
+                threading.Thread(target=_prefetch_pages, args=(titles, page.language, page.site)).start()
+
+def _get_page_sections_from_wiki(db: Database, page_name: str, lang: str, site: str, path: str) -> WikiPage | None:
+        """Get only the sections of a page that path points to.
+
+        The page's outline (its headings) is got first, and the path is found on a page made of the headings only.
+        Then the found sections' wikitexts are got (each with its subsections), and put on that page under their headings.
+        Outlines and sections are saved to database, and used from there when possible.
+
+        Returns a WikiPage with the found sections' contents, and the other sections empty. Returns None if the page is not found.
+        """
+        wiki = WikiApi(lang, site)
+        outline = None if options.FORCE_WEB else db.load_outline(page_name, lang, site)
+        if not outline:
+                outline = wiki.get_outline(page_name)
+                if not outline:
+                        if wiki.last_error == "missingtitle":
+                                db.save_failed_search(page_name, lang, site)
+                        return None
+                db.save_outline(page_name, lang, site, outline)
+        title, page_id, rev_id, headings = outline
+
+        outline_page = WikiPage(_outline_page_text(headings, {}), title, lang, site)
+        found_sections = outline_page.find_page_sections(path)
+        if not found_sections or (path.endswith(config.PATH_SEP) and len(path) > 1):
+                # nothing to show, or only the found sections' subsection structures are shown
+                return outline_page
+
+        indices = [s.index for s in found_sections]
+        contents = {} if options.FORCE_WEB else db.load_sections(lang, site, rev_id, indices)
+        fetched = {}
+        for index in indices:
+                wiki_index = "0" if index == 0 else headings[index - 1][2]
+                if index in contents or not wiki_index.isdigit():
+                        continue
+                log(f"Getting section {wiki_index} of {title}.")
+                section_text = wiki.get_section(rev_id, wiki_index)
+                if section_text is None:
+                        continue
+                fetched.update(_split_section_text(section_text, index, title, lang, site))
+                contents.update(fetched)
+
+        db.save_sections(lang, site, rev_id, fetched)
+        return WikiPage(_outline_page_text(headings, contents), title, lang, site, page_id=page_id, rev_id=rev_id)
+
+def _fetch_page_once(db: Database, page_name: str, lang: str, site: str, path: str | None) -> WikiPage | None:
+        """Get a page (or only the sections path points to, see _get_page_sections_from_wiki) from the wiki and save it,
+        unless another process saved it, or found that it doesn't exist, while this one waited for the fetch lock.
+        Returns None if the page is not found.
+        """
+        if not options.FORCE_WEB:
+                page = db.load_page(page_name, lang, site)
+                if page:
+                        log(f"Page {page.title} was saved by another process.")
+                        db.record_page_use(page)
+                        return page
+                if db.is_failed_search(page_name, lang, site):
+                        return None
+
+        if path and site == "wikipedia" and config.WIKI_FETCH_SECTIONS_ONLY:
+                log(f"Getting sections \"{path}\" from {site}.")
+                return _get_page_sections_from_wiki(db, page_name, lang, site, path)
+
+        log(f"Getting page from {site}.")
+        page = _get_page_from_wiki(page_name, lang, site, db)
+        if page:
+                log(f"Saving page {page.title}")
+                db.save_page(page)
+                # so that page_name finds the saved page, if the wiki normalized or redirected it to another title
+                db.save_aliases({ page_name : page.title }, lang, site)
+        return page
+
+def _outline_page_text(headings: list[tuple[int, str, str]], contents: dict[int, str]) -> str:
+        """Make a page's text out of its headings, and the contents of the sections (by index) that are known.
+        """
+        lines = [contents.get(0, "")]
+        for index, (level, heading_title, _) in enumerate(headings, 1):
+                lines.append("=" * level + heading_title + "=" * level)
+                lines.append(contents.get(index, ""))
+        return "\n".join(lines)
+
+def _split_section_text(section_text: str, index: int, title: str, lang: str, site: str) -> dict[int, str]:
+        """Split a section's wikitext into the section's and its subsections' own contents.
+        Returns a dict of section index and content, the section being at index.
+        """
+        if index == 0:
+                # the lead section has no heading or subsections
+                return { 0 : section_text }
+
+        section_page = WikiPage(section_text, title, lang, site)
+        contents = {}
+        unvisited = list(reversed(section_page.root_section.children))
+        while unvisited:
+                sect = unvisited.pop()
+                contents[index + sect.index - 1] = sect.content
+                unvisited += reversed(sect.children)
+        return contents
+
+def _is_language_scoped(path: str) -> bool:
+        """Check if a path only reaches sections under the page language's section.
+        """
+        keywords = WikiPage.search_keywords["definitions"] + WikiPage.search_keywords["translations"]
+        return path.lower() in keywords
+
 def search_wiki(word:str, language:str, site:str) -> None:
         """Runs the command for searching a wiki page.
         Returns None.
@@ -34,9 +251,16 @@ def search_wiki(word:str, language:str, site:str) -> None:
         log(f"Saving search \"{word}, {site}, {language}\".")
         db.save_search(word, site, language)
 
-        log(f"Searching wiki with \"{word}\".")
-        wiki = WikiApi(language, site)
-        results = wiki.search(word)
+        results = None if options.FORCE_WEB else db.load_search_results(word, site, language, config.WIKI_SEARCH_RESULTS_LIMIT)
+        db.count_cache_lookup("search results", results is not None)
+        if results is None:
+                log(f"Searching wiki with \"{word}\".")
+                wiki = WikiApi(language, site)
+                results = wiki.search(word)
+                db.save_search_results(word, site, language, config.WIKI_SEARCH_RESULTS_LIMIT, results)
+        else:
+                log(f"Got results of \"{word}\" from local database.")
+
         if len(results) > 0:
                 print("\n".join(results))
 
@@ -54,22 +278,143 @@ def fetch_wiki_page(word:str, language:str, path:str|None, site:str) -> None:
 
         if not options.FORCE_WEB:
                 log(f"Getting page from local database.")
-                page_from_db = db.load_page(word, language, site)
+                page_from_db = None
+                language_scoped = path is not None and site == "wiktionary" and _is_language_scoped(path)
+                if language_scoped:
+                        # only the page language's section is needed
+                        page_from_db = db.load_page_language(word, language, site, languages.abbrev_table[language][language])
+                if not page_from_db:
+                        page_from_db = db.load_page(word, language, site)
+                db.count_cache_lookup("pages", page_from_db is not None)
+
+                if not page_from_db and config.DB_SERVE_EXPIRED_PAGES:
+                        # print the expired page now, and update it for the next time after that
+                        if language_scoped:
+                                page_from_db = db.load_page_language(word, language, site, languages.abbrev_table[language][language], include_expired=True)
+                        if not page_from_db:
+                                page_from_db = db.load_page(word, language, site, include_expired=True)
+                        db.count_cache_lookup("expired pages", page_from_db is not None)
+                        if page_from_db:
+                                log(f"Saved page {page_from_db.title} has expired, refreshing it in the background.")
+                                # not a daemon thread, so the refresh finishes before the program exits
+                                threading.Thread(target=_refresh_saved_page, args=(word, language, site)).start()
+                                db.record_page_use(page_from_db)
+                                _print_page(page_from_db, path)
+                                return
+
+                if not page_from_db:
+                        failed_search = db.is_failed_search(word, language, site)
+                        db.count_cache_lookup("failed searches", failed_search)
+                        if failed_search:
+                                log(f"\"{word}\" was not found on {site} recently, not searching again.")
+                                cli_ui.not_found(word, language)
+                                return
+
+                if not page_from_db:
+                        log(f"Checking if the saved page has changed on {site}.")
+                        page_from_db = _revalidate_saved_page(db, word, language, site)
         else:
                 page_from_db = None
+                db.remove_failed_search(word, language, site)
 
-        if not page_from_db:
-                log(f"Getting page from {site}.")
-                page_from_web = _get_page_from_wiki(word, language, site)
-                if not page_from_web:
-                        cli_ui.not_found(word, language)
-                        return
-                log(f"Saving page {page_from_web.title}")
-                db.save_page(page_from_web)
+        if page_from_db:
+                db.record_page_use(page_from_db)
+                _print_page(page_from_db, path)
+                return
+
+        # only one process gets the page from the wiki at a time, the others use what it saved
+        with db.fetch_lock(word, language, site):
+                page = _fetch_page_once(db, word, language, site, path)
+        if not page:
+                cli_ui.not_found(word, language)
+                return
+        _print_page(page, path)
 
-                cli_ui.print_sections(page_from_web, path)
+def fetch_wiki_pages(words_file: str, language: str, site: str) -> None:
+        """Runs the command for getting and saving the pages of many words.
+        Words are read from words_file, one per line, or from stdin if words_file is "-".
+        Returns None.
+        """
+        if language not in languages.supported:
+                print(f"Unsupported language: \"{language}\"\nSee the help message for supported languages.")
+                return None
+
+        if words_file == "-":
+                words = sys.stdin.read().splitlines()
         else:
-                cli_ui.print_sections(page_from_db, path)
+                with open(words_file) as f:
+                        words = f.read().splitlines()
+        words = [w.strip() for w in words if w.strip()]
+
+        db = Database()
+        if not options.FORCE_WEB:
+                # saved pages that have expired are only got again if they've changed on the wiki
+                saved = db.get_page_revisions(words, language, site)
+                expired = [w for w in words if w in saved and saved[w][1] and saved[w][0] is not None]
+                unchanged = set()
+                if expired:
+                        latest = WikiApi(language, site).get_revision_ids(expired)
+                        unchanged = { w for w in expired if latest[w] and latest[w][2] == saved[w][0] }
+                        db.touch_pages(list(unchanged), language, site)
+                        log(f"{len(unchanged)} of {len(expired)} expired pages are up to date.")
+
+                words = [w for w in words if w not in saved or (saved[w][1] and w not in unchanged)]
+                log(f"{len(words)} words not in local database.")
+
+        pages = []
+        aliases = {}
+        not_found = []
+        failed = []
+        fetcher = Fetcher()
+        try:
+                for word, page, error in fetcher.fetch(language, site, words, cli_ui.print_progress):
+                        if error is not None:
+                                # the pages got so far are still saved
+                                log(f"Getting the page for \"{word}\" failed: {error!r}")
+                                failed.append(word)
+                                continue
+                        if not page:
+                                not_found.append(word)
+                                continue
+                        log(f"Got page {page.title} for \"{word}\".")
+                        if page.title not in aliases.values():
+                                # words that are aliases of each other get the same page
+                                pages.append(page)
+                        aliases[word] = page.title
+        finally:
+                fetcher.close()
+
+        for word in not_found:
+                cli_ui.not_found(word, language)
+        for word in failed:
+                cli_ui.fetch_failed(word, site)
+
+        saved = db.save_pages(pages)
+        db.save_aliases(aliases, language, site)
+        print(f"Saved {saved} pages.")
+
+def import_dump(dump_path: str, language: str, site: str, language_title: str|None) -> None:
+        """Runs the command for importing pages from a wiki's XML dump (.xml or .xml.bz2) into the local database.
+        If language_title is given, only pages with that language section are imported, with only that section.
+        Returns None.
+        """
+        if language not in languages.supported:
+                print(f"Unsupported language: \"{language}\"\nSee the help message for supported languages.")
+                return None
+
+        db = Database()
+        stats = DumpStats()
+        log(f"Importing pages from {dump_path}.")
+        pages = read_dump(dump_path, language, site, stats, language_title)
+        saved = db.import_pages(pages, lambda _: cli_ui.print_import_progress(stats))
+        cli_ui.print_import_progress(stats, done=True)
+        print(f"Saved {saved} pages.")
+        if db.is_over_cache_limits():
+                print(
+                        f"The saved pages are now over DB_PAGE_ARCHIVE_LENGTH ({config.DB_PAGE_ARCHIVE_LENGTH} pages) or MAX_DB_SIZE ({config.MAX_DB_SIZE}) in config.\n"
+                        "Saving more pages will remove the least used ones, imported ones too, unless the limits are raised.",
+                        file=sys.stderr
+                )
 
 def list_saved_pages():
         """Command for listing saved pages.
@@ -79,6 +424,14 @@ def list_saved_pages():
         pages = db.get_saved_pages()
         cli_ui.print_saved_pages(pages)
 
+def list_cache_stats():
+        """Command for listing the local database's cache hit and miss counts.
+        Returns None.
+        """
+        db = Database()
+        stats = db.get_cache_stats()
+        cli_ui.print_cache_stats(stats)
+
 def list_saved_searches():
         """Command for listing saved searches.
         Returns None.
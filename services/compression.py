@@ -0,0 +1,50 @@
+import re
+import zlib
+from collections import Counter
+
+import tools.config as config
+
+DICT_SIZE = 32 * 1024 # zlib can't refer further back than this, so a larger dictionary wouldn't help
+
+_TEMPLATE_START_REGEX = re.compile(r"\{\{[^{}|]*\|?")
+
+def compress(text: str, zdict: bytes | None=None) -> bytes:
+    """Compress a page's text with zlib, using the preset dictionary zdict if given.
+    """
+    if zdict is None:
+        return zlib.compress(text.encode(), config.DB_COMPRESSION_LEVEL)
+    compressor = zlib.compressobj(config.DB_COMPRESSION_LEVEL, zdict=zdict)
+    return compressor.compress(text.encode()) + compressor.flush()
+
+def decompress(data: bytes, zdict: bytes | None=None) -> str:
+    """Decompress a page's text compressed with compress(), with the same zdict.
+    """
+    if zdict is None:
+        return zlib.decompress(data).decode()
+    decompressor = zlib.decompressobj(zdict=zdict)
+    return (decompressor.decompress(data) + decompressor.flush()).decode()
+
+def train_dict(samples: list[str]) -> bytes:
+    """Make a zlib preset dictionary for pages like samples (e.g. pages of the same wiki and language).
+
+    The dictionary is made of the lines and template beginnings (e.g. "{{inflection of|") that are on most of the samples,
+    so that small pages, which don't repeat much of themselves, can refer to them instead.
+    The most common ones are put last, as zlib refers to the end of the dictionary with the fewest bits.
+    """
+    counts = Counter()
+    for text in samples:
+        # how many samples each string is on, not how many times
+        counts.update(set(text.splitlines()) | set(_TEMPLATE_START_REGEX.findall(text)))
+
+    picked = []
+    size = 0
+    for string, count in counts.most_common():
+        if count < 2 or len(string) < 4:
+            continue
+        encoded = string.encode() + b"\n"
+        if size + len(encoded) > DICT_SIZE:
+            break
+        picked.append(encoded)
+        size += len(encoded)
+
+    return b"".join(reversed(picked))
@@ -1,89 +1,454 @@
 import sqlite3
 import os
+import json
+import threading
+import time
+import random
+import zlib
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
+try:
+    import fcntl
+except ImportError: # not on posix systems, where fetches aren't coordinated between processes
+    fcntl = None
 
 import tools.config as config
 from tools.wikiparser import WikiPage, Section
 import tools.cfg_parsing_utils as cfg_parser
+from tools.logger import log
+from services import compression
 
-class Database():
-    def __init__(self) -> 'Database':
-        db_directory_path = os.path.expandvars(config.DB_DIRECTORY_PATH)
-        db_file_path = db_directory_path + "/" + config.DB_FILE_NAME
-        try:
-            os.mkdir(db_directory_path)
+def _page_key(page_name: str, page_site: str) -> str:
+    """Page name in the form pages are looked up by, so that names the wiki would take to the same page find the same saved page.
+    Underscores and extra whitespace are ignored, and on wikipedia the case of the first letter too, which is always uppercase there.
+    Titles are otherwise case sensitive, e.g. "Red dwarf" and "Red Dwarf" are different wikipedia pages.
+    """
+    key = " ".join(page_name.replace("_", " ").split())
+    return key[:1].upper() + key[1:] if page_site == "wikipedia" else key
 
-        except FileExistsError:
-            pass
+# The key of the page that a name's key is an alias of, if it is one (see Database.save_aliases). Takes key, language and site.
+_SQL_ALIAS_TARGET = "(SELECT A.name_key FROM PageAliases A WHERE A.alias_key = ? AND A.language = ? AND A.site = ?)"
 
-        self.__db = sqlite3.connect(db_file_path)
+def _normalize_query(query: str) -> str:
+    """Search query in the form it's saved in, so that e.g. "Cat ", "cat" and "CAT" share results.
+    Wikis' searches ignore case and extra whitespace anyway.
+    """
+    return " ".join(query.split()).casefold()
 
-        self.__db.isolation_level = None
-        self.__db.execute("PRAGMA foreign_keys = ON") # currently unused
-        self.__create_tables()
+_local = threading.local() # each thread's connection
+_fetch_lock_file = None
+_fetch_lock_file_lock = threading.Lock()
+_zdicts = {} # compression dictionaries by id, and ids and dictionaries by (site, language)
+_zdict_checks = Counter() # (site, language): pages written since checking if a compression dictionary could be made
 
+def _connection() -> sqlite3.Connection:
+    """The calling thread's connection to the database, opened when first needed.
 
+    sqlite3 connections can't be shared between threads, so each thread (e.g. a background refresh) gets its own,
+    and uses it for all Database objects it creates.
+    """
+    db = getattr(_local, "db", None)
+    if db is None:
+        db = _local.db = _connect()
+    return db
 
+def _connect() -> sqlite3.Connection:
+    db_directory_path = os.path.expandvars(config.DB_DIRECTORY_PATH)
+    db_file_path = db_directory_path + "/" + config.DB_FILE_NAME
+    os.makedirs(db_directory_path, exist_ok=True)
 
-    def __create_tables(self) -> None:
-        # TODO save page ids as well + case insensitive search from database.
-        # (
-        #   Getting a page from wikipedia seems to be *case insensitive*.
-        #   If getting a page from the db is *case sensitive*,
-        #   the same page cannot be accessed from db and from web
-        #   with the same search word.
-        # ) (getting pages from wiktionary though is case sensitive)
+    # sqlite3 keeps the connection's prepared statements cached by their sql, so sql strings are kept constant where possible.
+    # timeout is how long a statement waits for other processes' writes to finish before failing with "database is locked"
+    db = sqlite3.connect(db_file_path, timeout=config.DB_BUSY_TIMEOUT)
+    db.isolation_level = None # transactions are begun and committed explicitly
 
-        sql_create_pages_table = """
-            CREATE TABLE Pages (
-                id INTEGER PRIMARY KEY,
-                name TEXT,
-                site TEXT,
-                language TEXT,
-                content TEXT,
-                datetime DATETIME,
+    # WAL lets the background threads write while pages are read, and with synchronous = NORMAL commits don't wait for fsync
+    db.execute("PRAGMA journal_mode = WAL")
+    db.execute("PRAGMA synchronous = NORMAL")
+    db.execute(f"PRAGMA cache_size = {-int(config.DB_CACHE_SIZE)}")
+    db.execute(f"PRAGMA mmap_size = {int(config.DB_MMAP_SIZE)}")
+    db.execute("PRAGMA temp_store = MEMORY")
+    db.execute("PRAGMA foreign_keys = ON")
+    # for a new database, space freed by evicting pages is given back with PRAGMA incremental_vacuum (see Database.__evict)
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL")
 
-                CONSTRAINT UC_Pages UNIQUE(name, language, site)
-                CONSTRAINT CHK_PageSite CHECK (site = 'wikipedia' OR site = 'wiktionary')
-            )
-        """
-        sql_create_searches_table ="""
-            CREATE TABLE Searches (
-                id INTEGER PRIMARY KEY,
-                text TEXT,
-                site TEXT,
-                language TEXT,
-                datetime DATETIME
-            )
-        """
+    _migrate(db)
+    return db
+
+def _migrate(db: sqlite3.Connection) -> None:
+    """Bring the database's schema up to date.
+
+    The schema's version is kept in PRAGMA user_version, and is the number of migrations done.
+    An up to date database only needs the version checked, so no DDL is run on startup.
+    """
+    if db.execute("PRAGMA user_version").fetchone()[0] >= len(_MIGRATIONS):
+        return
+
+    # another process can't be migrating at the same time, as the write lock is taken right away
+    _begin(db)
+    try:
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        for migration in _MIGRATIONS[version:]:
+            migration(db)
+        db.execute(f"PRAGMA user_version = {len(_MIGRATIONS)}")
+    except BaseException as e:
+        db.execute("ROLLBACK")
+        raise e
+    db.execute("COMMIT")
+
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        # a database made before auto_vacuum was set needs to be rebuilt for it once.
+        # If that fails (e.g. another process is using the database), evicted pages' space is still reused, just not given back.
+        try:
+            db.execute("VACUUM")
+        except sqlite3.OperationalError as e:
+            log("Couldn't turn on incremental vacuum:", e)
+
+def _begin(db: sqlite3.Connection) -> None:
+    """Begin a transaction that can write, waiting for other processes' writes to finish first.
+
+    The write lock is taken right away (BEGIN IMMEDIATE). A transaction that only takes it on its first write
+    fails at once if another process has written since the transaction began, as waiting wouldn't help then.
+    If the lock isn't got in DB_BUSY_TIMEOUT, retries DB_BUSY_RETRIES times after a random, exponentially growing wait.
+    """
+    for attempt in range(config.DB_BUSY_RETRIES + 1):
         try:
-            self.__db.execute(sql_create_pages_table)
-            self.__db.execute("CREATE INDEX idx_name ON Pages (name)")
+            db.execute("BEGIN IMMEDIATE")
+            return
         except sqlite3.OperationalError as e:
-            if "already exists" not in e.__str__():
+            if "locked" not in e.__str__() and "busy" not in e.__str__() or attempt == config.DB_BUSY_RETRIES:
                 raise e
+            delay = random.uniform(0, 0.1 * 2 ** attempt)
+            log(f"Database is locked, retrying in {delay:.2f}s.")
+            time.sleep(delay)
 
+def _fetch_lock_fd() -> int:
+    """The process' file descriptor of the lock file used by Database.fetch_lock.
+    It's kept open, as closing any descriptor of the file would release all of the process' locks on it.
+    """
+    global _fetch_lock_file
+    with _fetch_lock_file_lock:
+        if _fetch_lock_file is None:
+            db_directory_path = os.path.expandvars(config.DB_DIRECTORY_PATH)
+            _fetch_lock_file = open(db_directory_path + "/" + config.DB_FILE_NAME + ".fetch-lock", "a")
+        return _fetch_lock_file.fileno()
+
+def _create_tables(db: sqlite3.Connection) -> None:
+    """Migration 1: the tables from before the schema was versioned.
+    Databases made then don't have a version, so tables and columns that already exist are skipped.
+    """
+    # Pages are looked up by their names' keys since migration 4 (see _add_page_keys).
+
+    sql_create_pages_table = """
+        CREATE TABLE IF NOT EXISTS Pages (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            site TEXT,
+            language TEXT,
+            content TEXT,
+            datetime DATETIME,
+
+            CONSTRAINT UC_Pages UNIQUE(name, language, site)
+            CONSTRAINT CHK_PageSite CHECK (site = 'wikipedia' OR site = 'wiktionary')
+        )
+    """
+    sql_create_searches_table ="""
+        CREATE TABLE IF NOT EXISTS Searches (
+            id INTEGER PRIMARY KEY,
+            text TEXT,
+            site TEXT,
+            language TEXT,
+            datetime DATETIME
+        )
+    """
+    db.execute(sql_create_pages_table)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_name ON Pages (name)")
+
+    # the wiki's ids of the page and of the saved revision, for checking if the saved page is still up to date
+    for column in ("pageid INTEGER", "revid INTEGER"):
         try:
-            self.__db.execute(sql_create_searches_table)
+            db.execute("ALTER TABLE Pages ADD COLUMN " + column)
         except sqlite3.OperationalError as e:
-            if "already exists" not in e.__str__():
+            if "duplicate column name" not in e.__str__():
                 raise e
 
+    db.execute(sql_create_searches_table)
+
+    # Language (level 2) sections' positions in saved pages' content
+    sql_create_page_languages_table = """
+        CREATE TABLE IF NOT EXISTS PageLanguages (
+            page_id INTEGER REFERENCES Pages(id) ON DELETE CASCADE,
+            title TEXT,
+            start INTEGER,
+            length INTEGER,
+
+            CONSTRAINT UC_PageLanguages UNIQUE(page_id, title)
+        )
+    """
+    db.execute(sql_create_page_languages_table)
+
+    # Pages' section headings, for getting only some sections of a page (see WikiApi.get_outline)
+    sql_create_page_outlines_table = """
+        CREATE TABLE IF NOT EXISTS PageOutlines (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            site TEXT,
+            language TEXT,
+            title TEXT,
+            pageid INTEGER,
+            revid INTEGER,
+            headings TEXT,
+            datetime DATETIME,
+
+            CONSTRAINT UC_PageOutlines UNIQUE(name, language, site)
+        )
+    """
+    # Sections' wikitexts by revision. A revision's content never changes, so these don't expire.
+    sql_create_page_sections_table = """
+        CREATE TABLE IF NOT EXISTS PageSections (
+            id INTEGER PRIMARY KEY,
+            site TEXT,
+            language TEXT,
+            revid INTEGER,
+            section INTEGER,
+            content TEXT,
+            datetime DATETIME,
+
+            CONSTRAINT UC_PageSections UNIQUE(revid, section, language, site)
+        )
+    """
+    # Pages that weren't found on the wiki
+    sql_create_failed_searches_table = """
+        CREATE TABLE IF NOT EXISTS FailedSearches (
+            id INTEGER PRIMARY KEY,
+            name TEXT,
+            site TEXT,
+            language TEXT,
+            datetime DATETIME,
+
+            CONSTRAINT UC_FailedSearches UNIQUE(name, language, site)
+        )
+    """
+    sql_create_cache_stats_table = """
+        CREATE TABLE IF NOT EXISTS CacheStats (
+            cache TEXT PRIMARY KEY,
+            hits INTEGER DEFAULT 0,
+            misses INTEGER DEFAULT 0
+        )
+    """
+    # Results of searches on wikis (see WikiApi.search)
+    sql_create_search_results_table = """
+        CREATE TABLE IF NOT EXISTS SearchResults (
+            id INTEGER PRIMARY KEY,
+            query TEXT,
+            site TEXT,
+            language TEXT,
+            result_limit INTEGER,
+            results TEXT,
+            datetime DATETIME,
+            last_used DATETIME,
+
+            CONSTRAINT UC_SearchResults UNIQUE(query, language, site, result_limit)
+        )
+    """
+    for sql in (sql_create_page_outlines_table, sql_create_page_sections_table, sql_create_failed_searches_table, sql_create_cache_stats_table, sql_create_search_results_table):
+        db.execute(sql)
+
+def _add_page_access_columns(db: sqlite3.Connection) -> None:
+    """Migration 2: when and how many times saved pages have been used, for choosing which pages to evict (see Database.__evict).
+    """
+    db.execute("ALTER TABLE Pages ADD COLUMN last_access DATETIME")
+    db.execute("ALTER TABLE Pages ADD COLUMN hits INTEGER DEFAULT 0")
+    db.execute("UPDATE Pages SET last_access = datetime")
+    db.execute("CREATE INDEX idx_last_access ON Pages (last_access)")
+
+def _add_page_compression(db: sqlite3.Connection) -> None:
+    """Migration 3: saved pages' contents are compressed (see Database.__encode_content).
+    Pages saved before this are compressed a few at a time after writes (see Database.__compress_saved_pages).
+    """
+    # NULL: content is plain text, 0: compressed with zlib, n: compressed with zlib and the dictionary with id n
+    db.execute("ALTER TABLE Pages ADD COLUMN compression INTEGER")
+
+    # zlib preset dictionaries for compressing a site's and language's pages (see compression.train_dict)
+    sql_create_compression_dicts_table = """
+        CREATE TABLE CompressionDicts (
+            id INTEGER PRIMARY KEY,
+            site TEXT,
+            language TEXT,
+            dict BLOB,
+            datetime DATETIME,
+
+            CONSTRAINT UC_CompressionDicts UNIQUE(language, site)
+        )
+    """
+    db.execute(sql_create_compression_dicts_table)
+
+def _add_page_keys(db: sqlite3.Connection) -> None:
+    """Migration 4: pages are looked up by their names' keys (see _page_key), and by aliases of their names.
+    """
+    db.execute("ALTER TABLE Pages ADD COLUMN name_key TEXT")
+    db.executemany(
+        "UPDATE Pages SET name_key = ? WHERE id = ?",
+        [(_page_key(name, site), row_id) for row_id, name, site in db.execute("SELECT id, name, site FROM Pages").fetchall()]
+    )
+    # (name, language, site) is already indexed by UC_Pages, and lookups by name alone aren't done
+    db.execute("DROP INDEX IF EXISTS idx_name")
+    db.execute("CREATE INDEX idx_page_key ON Pages (name_key, language, site)")
+
+    # Other names of saved pages, from the wiki's normalizations and redirects of the names pages were got with
+    sql_create_page_aliases_table = """
+        CREATE TABLE PageAliases (
+            id INTEGER PRIMARY KEY,
+            alias_key TEXT,
+            name_key TEXT,
+            site TEXT,
+            language TEXT,
+            datetime DATETIME,
+
+            CONSTRAINT UC_PageAliases UNIQUE(alias_key, language, site)
+        )
+    """
+    db.execute(sql_create_page_aliases_table)
+
+# Tables that eviction removes rows from, and their columns whose sizes count towards MAX_DB_SIZE (see Database.__evict)
+_CACHE_SIZE_COLUMNS = {
+    "Pages": "content",
+    "PageOutlines": "headings",
+    "PageSections": "content",
+}
+
+def _add_cache_sizes(db: sqlite3.Connection) -> None:
+    """Migration 5: bookkeeping for eviction (see Database.__evict).
+
+    The number of rows in the tables that eviction removes from, and the size of their contents, are kept in CacheSizes by triggers,
+    so that they don't need to be counted on every write. A page's aliases are removed with it,
+    and a revision's sections with the last outline of that revision.
+    """
+    # sections of revisions that are no outline's anymore can't be found
+    db.execute("""
+        DELETE FROM PageSections WHERE NOT EXISTS (
+            SELECT 1 FROM PageOutlines O WHERE O.revid = PageSections.revid AND O.language = PageSections.language AND O.site = PageSections.site
+        )
+    """)
+
+    db.execute("CREATE TABLE CacheSizes (name TEXT PRIMARY KEY, rows INTEGER, bytes INTEGER)")
+    for table, column in _CACHE_SIZE_COLUMNS.items():
+        # in bytes: the length of text is counted in characters
+        old_size = f"IFNULL(LENGTH(CAST(old.{column} AS BLOB)), 0)"
+        new_size = f"IFNULL(LENGTH(CAST(new.{column} AS BLOB)), 0)"
+        db.execute(f"INSERT INTO CacheSizes SELECT '{table}', COUNT(*), IFNULL(SUM(LENGTH(CAST({column} AS BLOB))), 0) FROM {table}")
+        db.execute(f"""
+            CREATE TRIGGER {table}_insert_size AFTER INSERT ON {table} BEGIN
+                UPDATE CacheSizes SET rows = rows + 1, bytes = bytes + {new_size} WHERE name = '{table}';
+            END
+        """)
+        db.execute(f"""
+            CREATE TRIGGER {table}_delete_size AFTER DELETE ON {table} BEGIN
+                UPDATE CacheSizes SET rows = rows - 1, bytes = bytes - {old_size} WHERE name = '{table}';
+            END
+        """)
+        db.execute(f"""
+            CREATE TRIGGER {table}_update_size AFTER UPDATE OF {column} ON {table} BEGIN
+                UPDATE CacheSizes SET bytes = bytes - {old_size} + {new_size} WHERE name = '{table}';
+            END
+        """)
+
+    db.execute("CREATE INDEX idx_alias_name_key ON PageAliases (name_key, language, site)")
+    db.execute("""
+        CREATE TRIGGER Pages_delete_aliases AFTER DELETE ON Pages BEGIN
+            DELETE FROM PageAliases WHERE name_key = old.name_key AND language = old.language AND site = old.site;
+        END
+    """)
+
+    db.execute("CREATE INDEX idx_outline_revid ON PageOutlines (revid)")
+    db.execute("CREATE INDEX idx_outline_datetime ON PageOutlines (datetime)")
+    sql_delete_revision_sections = """
+        DELETE FROM PageSections WHERE revid = old.revid AND language = old.language AND site = old.site AND NOT EXISTS (
+            SELECT 1 FROM PageOutlines O WHERE O.revid = old.revid AND O.language = old.language AND O.site = old.site
+        );
+    """
+    db.execute(f"CREATE TRIGGER PageOutlines_delete_sections AFTER DELETE ON PageOutlines BEGIN {sql_delete_revision_sections} END")
+    db.execute(f"""
+        CREATE TRIGGER PageOutlines_update_sections AFTER UPDATE OF revid ON PageOutlines WHEN old.revid IS NOT new.revid BEGIN
+            {sql_delete_revision_sections}
+        END
+    """)
+
+def _fix_wikipedia_page_keys(db: sqlite3.Connection) -> None:
+    """Migration 6: only the first letter of wikipedia pages' keys is case insensitive (see _page_key), all of it was before.
+    Wikipedia pages' aliases are removed, as the case of their names wasn't kept. They are saved again as pages are got from the wiki.
+    """
+    db.executemany(
+        "UPDATE Pages SET name_key = ? WHERE id = ?",
+        [(_page_key(name, site), row_id) for row_id, name, site in db.execute("SELECT id, name, site FROM Pages WHERE site = 'wikipedia'").fetchall()]
+    )
+    db.execute("DELETE FROM PageAliases WHERE site = 'wikipedia'")
+
+def _index_uncompressed_pages(db: sqlite3.Connection) -> None:
+    """Migration 7: pages saved before pages were compressed are indexed, so that they can be found to be compressed (see Database.__compress_saved_pages).
+    """
+    db.execute("CREATE INDEX idx_uncompressed_pages ON Pages (id) WHERE compression IS NULL")
+
+# Functions bringing the schema from one version to the next, in order. Only add new ones to the end.
+_MIGRATIONS = [
+    _create_tables,
+    _add_page_access_columns,
+    _add_page_compression,
+    _add_page_keys,
+    _add_cache_sizes,
+    _fix_wikipedia_page_keys,
+    _index_uncompressed_pages,
+]
+
+# Order of eviction of saved pages for each DB_EVICTION_POLICY, first evicted first
+_EVICTION_ORDERS = {
+    "lru" : "last_access ASC",
+    "lfu" : "hits ASC, last_access ASC",
+    # uses per day since last use, i.e. pages used often but not lately are evicted eventually too
+    "hybrid" : "(hits + 1) / (julianday('now', 'localtime') - julianday(last_access) + 1) ASC",
+}
+
+class Database():
+    def __init__(self) -> 'Database':
+        self.__db = _connection()
+
+    @contextmanager
+    def __transaction(self):
+        """Run the statements in the with block in one transaction, or in the enclosing one if there is one.
+        Rolls back if the block raises.
+        """
+        if self.__db.in_transaction:
+            yield
+            return
+
+        _begin(self.__db)
+        try:
+            yield
+        except BaseException as e:
+            self.__db.execute("ROLLBACK")
+            raise e
+        self.__db.execute("COMMIT")
+
 
 
 
     def save_search(self, search: str, site: str, lang: str) -> None:
         """Save a search to database.
 
+        Only the DB_SEARCH_ARCHIVE_LENGTH latest searches are kept, older ones are removed.
         If DB_SAVE_SEARCHES is set to False in config, search is not saved.
         """
         if config.DB_SAVE_SEARCHES == False:
             return None
 
-        self.__db.execute(
-            "INSERT INTO Searches (text, site, language, datetime) VALUES (?, ?, ?, DATETIME('now', 'localtime'))",
-            [search, site, lang]
-        )
+        with self.__transaction():
+            search_id = self.__db.execute(
+                "INSERT INTO Searches (text, site, language, datetime) VALUES (?, ?, ?, DATETIME('now', 'localtime')) RETURNING id",
+                [search, site, lang]
+            ).fetchone()[0]
+            # only the DB_SEARCH_ARCHIVE_LENGTH latest searches are kept
+            self.__db.execute("DELETE FROM Searches WHERE id <= ?", [search_id - config.DB_SEARCH_ARCHIVE_LENGTH])
 
     def save_page(self, page: WikiPage) -> None:
         """Save a wikipage to database.
@@ -93,54 +458,659 @@ class Database():
         if config.DB_SAVE_PAGES == False:
             return None
 
+        self.__make_zdict(page.site, page.language)
+        with self.__transaction():
+            page_id = self.__write_page(page)
+            self.__evict(config.DB_EVICTIONS_PER_WRITE, written_pages=[page_id])
+        self.__vacuum(config.DB_VACUUM_PAGES_PER_WRITE)
+
+    def save_pages(self, pages: list[WikiPage]) -> int:
+        """Save many wikipages to database in one transaction.
+
+        If saving any of the pages fails, none of them are saved.
+        If DB_SAVE_PAGES is set to False in config, pages are not saved.
+        Returns the number of pages saved.
+        """
+        if config.DB_SAVE_PAGES == False:
+            return 0
+
+        for site, language in {(page.site, page.language) for page in pages}:
+            self.__make_zdict(site, language)
+        page_ids = []
+        with self.__transaction():
+            for page in pages:
+                page_ids.append(self.__write_page(page))
+            self.__evict(config.DB_EVICTIONS_PER_WRITE * len(page_ids), written_pages=page_ids)
+        self.__vacuum(config.DB_VACUUM_PAGES_PER_WRITE)
+        return len(page_ids)
+
+    def import_pages(self, pages, progress: callable=None) -> int:
+        """Save pages from an iterable of WikiPages, e.g. pages read from a dump, in transactions of DB_IMPORT_BATCH_SIZE pages.
+
+        The page key index is dropped for the import and created again at the end, which is faster than updating it for each page.
+        No saved pages are removed to keep within DB_PAGE_ARCHIVE_LENGTH and MAX_DB_SIZE, as a dump is usually larger than them,
+        so the pages imported first would be removed by the end (see is_over_cache_limits).
+        progress is called with the number of pages saved after each transaction.
+        Pages are saved even if DB_SAVE_PAGES is set to False in config.
+        Returns the number of pages saved.
+        """
+        self.__db.execute("DROP INDEX IF EXISTS idx_page_key")
+        count = 0
+        imported = Counter() # pages saved by (site, language)
         try:
-            self.__db.execute(
-                "INSERT INTO Pages (name, language, content, site, datetime) VALUES (?, ?, ?, ?, DATETIME('now', 'localtime'))",
-                [page.title, page.language, page.text, page.site]
-            )
+            _begin(self.__db)
+            for page in pages:
+                self.__write_page(page)
+                imported[(page.site, page.language)] += 1
+                count += 1
+                if count % config.DB_IMPORT_BATCH_SIZE == 0:
+                    self.__db.execute("COMMIT")
+                    self.__vacuum(config.DB_VACUUM_PAGES_PER_WRITE)
+                    # between transactions, and without counting pages, as the index for it is dropped
+                    for (site, language), written in imported.items():
+                        if written >= config.DB_COMPRESSION_DICT_SAMPLES:
+                            self.__make_zdict(site, language, written)
+                    if progress:
+                        progress(count)
+                    _begin(self.__db)
+            self.__db.execute("COMMIT")
+            self.__vacuum(config.DB_VACUUM_PAGES_PER_WRITE)
+            if progress:
+                progress(count)
+
+        except BaseException as e:
+            # keep the pages of the transactions done so far
+            if self.__db.in_transaction:
+                self.__db.execute("ROLLBACK")
+            raise e
+
+        finally:
+            self.__db.execute("CREATE INDEX IF NOT EXISTS idx_page_key ON Pages (name_key, language, site)")
+
+        return count
+
+    def __write_page(self, page: WikiPage) -> int:
+        """Save a page, returning its row's id.
+        """
+        # update page if it's already saved. Saving a new page counts as its first use, as it's saved when it's got for use.
+        sql_upsert_page = """
+            INSERT INTO Pages (name, name_key, language, content, compression, site, pageid, revid, datetime, last_access, hits)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, DATETIME('now', 'localtime'), STRFTIME('%Y-%m-%d %H:%M:%f', 'now', 'localtime'), 1)
+            ON CONFLICT (name, language, site) DO UPDATE SET
+                content = excluded.content, compression = excluded.compression, pageid = excluded.pageid, revid = excluded.revid,
+                datetime = excluded.datetime, last_access = excluded.last_access
+            RETURNING id
+        """
+        content, compression_id = self.__encode_content(page.text, page.site, page.language)
+        page_id = self.__db.execute(
+            sql_upsert_page,
+            [page.title, _page_key(page.title, page.site), page.language, content, compression_id, page.site, page.page_id, page.rev_id]
+        ).fetchone()[0]
+
+        self.__save_page_languages(page_id, page)
+        # the page exists after all
+        self.__db.execute("DELETE FROM FailedSearches WHERE name = ? AND language = ? AND site = ?", [page.title, page.language, page.site])
+        return page_id
+
+    def __encode_content(self, text: str, site: str, language: str) -> tuple[str | bytes, int | None]:
+        """Page content as it's saved: compressed with zlib, with the site's and language's dictionary if there is one.
+        Returns the content and its compression (see _add_page_compression).
+        If DB_COMPRESS_PAGES is set to False in config, content is saved as plain text.
+        """
+        if config.DB_COMPRESS_PAGES == False:
+            return text, None
+
+        zdict = self.__zdict_for_writing(site, language)
+        if zdict is None:
+            return compression.compress(text), 0
+        return compression.compress(text, zdict[1]), zdict[0]
+
+    def __decode_content(self, content: str | bytes, compression_id: int | None) -> str:
+        if compression_id is None:
+            return content
+        if compression_id == 0:
+            return compression.decompress(content)
+
+        if compression_id not in _zdicts:
+            _zdicts[compression_id] = self.__db.execute("SELECT dict FROM CompressionDicts WHERE id = ?", [compression_id]).fetchone()[0]
+        return compression.decompress(content, _zdicts[compression_id])
+
+    def __zdict_for_writing(self, site: str, language: str) -> tuple[int, bytes] | None:
+        """The id and the compression dictionary of site's and language's pages, or None if none has been made yet (see __make_zdict).
+        """
+        key = (site, language)
+        if key not in _zdicts:
+            _zdict_checks[key] += 1
+            return None
+        return _zdicts[key]
+
+    def __make_zdict(self, site: str, language: str, pages_written: int=0) -> None:
+        """Make a compression dictionary for site's and language's pages out of saved pages, once there are DB_COMPRESSION_DICT_SAMPLES of them.
+        Checks on the first call, then again after every DB_COMPRESSION_DICT_SAMPLES pages written by this process.
+        pages_written: pages of site and language known to have been saved, which are then not counted again.
+
+        Called before starting write transactions, so that other processes aren't kept waiting while the dictionary is made.
+        """
+        key = (site, language)
+        if key in _zdicts or config.DB_COMPRESS_PAGES == False or config.DB_COMPRESSION_DICTS == False:
+            return None
+        if key in _zdict_checks and _zdict_checks[key] < config.DB_COMPRESSION_DICT_SAMPLES:
+            return None
+        _zdict_checks[key] = 0
+
+        sql_get_dict = "SELECT id, dict FROM CompressionDicts WHERE site = ? AND language = ?"
+        zdict = self.__db.execute(sql_get_dict, [site, language]).fetchone()
+        if zdict is None:
+            # counted before reading any contents, which takes long and is mostly for nothing
+            if pages_written < config.DB_COMPRESSION_DICT_SAMPLES:
+                pages_written = self.__db.execute(
+                    "SELECT COUNT(*) FROM (SELECT 1 FROM Pages WHERE site = ? AND language = ? LIMIT ?)",
+                    [site, language, config.DB_COMPRESSION_DICT_SAMPLES]
+                ).fetchone()[0]
+                if pages_written < config.DB_COMPRESSION_DICT_SAMPLES:
+                    return None
+
+            samples = self.__db.execute(
+                "SELECT content, compression FROM Pages WHERE site = ? AND language = ? ORDER BY id DESC LIMIT ?",
+                [site, language, config.DB_COMPRESSION_DICT_SAMPLES]
+            ).fetchall()
+            if len(samples) < config.DB_COMPRESSION_DICT_SAMPLES:
+                return None
 
-        except sqlite3.IntegrityError: # update page if it's already saved
+            log(f"Making a compression dictionary for {language}.{site} pages.")
+            trained = compression.train_dict([self.__decode_content(content, compression_id) for content, compression_id in samples])
+            # another process may have made one first
             self.__db.execute(
-                "UPDATE Pages SET content = ?, datetime = DATETIME('now', 'localtime') WHERE name = ? AND language = ? AND site = ?",
-                [page.text, page.title, page.language, page.site]
+                "INSERT OR IGNORE INTO CompressionDicts (site, language, dict, datetime) VALUES (?, ?, ?, DATETIME('now', 'localtime'))",
+                [site, language, trained]
             )
+            zdict = self.__db.execute(sql_get_dict, [site, language]).fetchone()
+
+        _zdicts[key] = zdict
+        _zdicts[zdict[0]] = zdict[1]
+
+    def __evict(self, max_rows: int, written_pages: list[int]=(), written_outlines: list[int]=()) -> None:
+        """Remove saved pages while there are more than DB_PAGE_ARCHIVE_LENGTH of them, and saved outlines (and their revisions' sections)
+        while there are more than DB_PAGE_ARCHIVE_LENGTH of those. Remove both while their contents take more than MAX_DB_SIZE.
+        Pages are removed in the order of DB_EVICTION_POLICY, outlines oldest first.
+        The pages and outlines just written (written_pages and written_outlines, by id) are never removed, even if they'd be first.
+
+        Only what can be removed here counts towards MAX_DB_SIZE, so that e.g. saved searches can't get every page removed.
+        The rows and sizes are kept count of by triggers (see _add_cache_sizes).
 
+        At most max_rows pages and max_rows outlines are removed, so that eviction is done a little at a time on each write instead of all at once.
+        Removed rows' space in the database file is given back a little at a time too, after the write (see __vacuum).
+        """
+        if max_rows <= 0:
+            return
+
+        sizes = self.__cache_sizes()
+        over_size = sum(size for _, size in sizes.values()) > cfg_parser.size_to_bytes(config.MAX_DB_SIZE)
+
+        for table, order, written_ids in (
+            ("Pages", _EVICTION_ORDERS[config.DB_EVICTION_POLICY], written_pages),
+            ("PageOutlines", "datetime ASC", written_outlines),
+        ):
+            rows = sizes[table][0]
+            evict_count = min(rows if over_size else max(rows - config.DB_PAGE_ARCHIVE_LENGTH, 0), max_rows)
+            if evict_count > 0:
+                self.__db.execute(
+                    f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE id NOT IN (SELECT value FROM json_each(?)) ORDER BY {order} LIMIT ?)",
+                    [json.dumps(written_ids), evict_count]
+                )
+
+    def __cache_sizes(self) -> dict[str, tuple[int, int]]:
+        """The rows and content bytes of the tables __evict removes rows from, by table.
+        """
+        return {table: (rows, size) for table, rows, size in self.__db.execute("SELECT name, rows, bytes FROM CacheSizes")}
 
+    def is_over_cache_limits(self) -> bool:
+        """Whether there are more saved pages or outlines than DB_PAGE_ARCHIVE_LENGTH, or their contents take more than MAX_DB_SIZE,
+        i.e. whether saving pages will remove some (see __evict). This can be after import_pages(), which doesn't remove any.
+        """
+        sizes = self.__cache_sizes()
+        return (
+            sum(size for _, size in sizes.values()) > cfg_parser.size_to_bytes(config.MAX_DB_SIZE)
+            or max(sizes["Pages"][0], sizes["PageOutlines"][0]) > config.DB_PAGE_ARCHIVE_LENGTH
+        )
 
+    def __vacuum(self, max_pages: int | None) -> None:
+        """Give back up to max_pages (all if None) database pages of free space to the file system,
+        and compress up to DB_COMPRESSIONS_PER_WRITE saved pages that aren't compressed yet (see __compress_saved_pages).
+        """
+        if self.__db.in_transaction:
+            # executescript() would commit the transaction
+            return
+        self.__compress_saved_pages(config.DB_COMPRESSIONS_PER_WRITE)
+        # execute() would run only the first step of the pragma, which frees one page per step
+        self.__db.executescript("PRAGMA incremental_vacuum" if max_pages is None else f"PRAGMA incremental_vacuum({int(max_pages)})")
+
+    def __compress_saved_pages(self, max_rows: int) -> None:
+        """Compress the contents of up to max_rows pages saved before pages were compressed.
+        Done a few at a time after writes, so that neither migrating nor reading pages has to.
+        """
+        if config.DB_COMPRESS_PAGES == False or max_rows <= 0:
+            return None
+
+        # found with idx_uncompressed_pages (see _index_uncompressed_pages), as the compression column comes after the content
+        rows = self.__db.execute("SELECT id, content, site, language FROM Pages WHERE compression IS NULL LIMIT ?", [max_rows]).fetchall()
+        if not rows:
+            return None
+
+        # compressed before the write transaction, so that it's held only for the updates
+        updates = []
+        for row_id, text, site, language in rows:
+            content, compression_id = self.__encode_content(text, site, language)
+            updates.append((content, compression_id, row_id))
+        with self.__transaction():
+            # the page may have been saved again meanwhile
+            self.__db.executemany("UPDATE Pages SET content = ?, compression = ? WHERE id = ? AND compression IS NULL", updates)
+
+    def __save_page_languages(self, page_id: int, page: WikiPage) -> None:
+        """Save the positions of a saved page's language sections, so that they can be loaded without the rest of the page.
+        """
+        self.__db.execute("DELETE FROM PageLanguages WHERE page_id = ?", [page_id])
+        self.__db.executemany(
+            "INSERT OR IGNORE INTO PageLanguages (page_id, title, start, length) VALUES (?, ?, ?, ?)",
+            [(page_id, title, start, end - start) for title, start, end in page.language_spans()]
+        )
+
+
+
+
+    def record_page_use(self, page: WikiPage) -> None:
+        """Mark a saved page as used now, for eviction (see __evict).
+
+        Called once for each lookup a saved page is shown for, instead of by load_page(), which also loads pages just to check on them.
+        This way reading a page writes to the database once at most, and pages aren't counted as used more often than they are.
+        """
+        # in milliseconds, to tell apart pages used during the same second
+        self.__db.execute(
+            "UPDATE Pages SET last_access = STRFTIME('%Y-%m-%d %H:%M:%f', 'now', 'localtime'), hits = hits + 1 WHERE name = ? AND language = ? AND site = ?",
+            [page.title, page.language, page.site]
+        )
 
-    def load_page(self, page_name: str, page_language: str, page_site: str) -> WikiPage | None:
+    def load_page(self, page_name: str, page_language: str, page_site: str, include_expired: bool=False) -> WikiPage | None:
         """Load a wiki page from database.
 
         Gets a saved page from database and constructs WikiPage object of that page.
 
         Returns None if:
         - the requested page doesn't exist in database
-        - the requested page's addition datetime exceeds the DB_PAGE_EXPIRATION_TIME defined in config
+        - the requested page's addition datetime exceeds the DB_PAGE_EXPIRATION_TIME defined in config, unless include_expired is True
         - DB_USE_SAVED_PAGES is set to False in config
 
-        Page name matching is case sensitive.
+        Pages are matched by their names' keys (see _page_key) and aliases (see save_aliases),
+        so e.g. "python" finds a saved wikipedia page "Python", but "Red dwarf" doesn't find "Red Dwarf". A page with exactly page_name is preferred.
         """
         if config.DB_USE_SAVED_PAGES == False:
             return None
 
-        sql_get_page = """
+        sql_get_page = f"""
             SELECT
-                P.name, P.content, P.language, P.datetime, P.site
+                P.name, P.content, P.language, P.datetime, P.site, P.pageid, P.revid, P.id, P.compression
             FROM
                 Pages P
             WHERE
-                P.name = ? AND P.language = ? AND P.site = ?
+                P.name_key IN (?, {_SQL_ALIAS_TARGET}) AND P.language = ? AND P.site = ?
+            ORDER BY
+                P.name = ? DESC
+            LIMIT 1
+        """
+        key = _page_key(page_name, page_site)
+        page = self.__db.execute(sql_get_page, [key, key, page_language, page_site, page_language, page_site, page_name]).fetchone()
+        if page == None:
+            return None
+
+        title, language, date, site = page[0], page[2], datetime.fromisoformat(page[3]), page[4]
+
+        if  self.page_needs_update(date) and not include_expired:
+            return None
+        else:
+            text = self.__decode_content(page[1], page[8])
+            return WikiPage(text, title, language, site, lazy=True, page_id=page[5], rev_id=page[6])
+
+    def get_page_revisions(self, page_names: list[str], page_language: str, page_site: str) -> dict[str, tuple[int | None, bool]]:
+        """Get the revision ids of saved pages, and whether the pages have expired (see load_page()).
+
+        Returns a dict of the names of the pages that are saved and tuples of revid (None if not known) and expiry.
+        Pages are matched like in load_page().
+        """
+        keys = { name : _page_key(name, page_site) for name in page_names }
+        unique_keys = list(dict.fromkeys(keys.values()))
+        aliases = {}
+        saved = {}
+        # stay under SQLite's limit of variables in a statement
+        for i in range(0, len(unique_keys), 400):
+            batch = unique_keys[i : i + 400]
+            batch_aliases = dict(self.__db.execute(
+                f"SELECT alias_key, name_key FROM PageAliases WHERE language = ? AND site = ? AND alias_key IN ({', '.join('?' * len(batch))})",
+                [page_language, page_site, *batch]
+            ).fetchall())
+            aliases.update(batch_aliases)
+
+            batch_keys = list(dict.fromkeys(batch + list(batch_aliases.values())))
+            rows = self.__db.execute(
+                f"SELECT name_key, revid, datetime FROM Pages WHERE language = ? AND site = ? AND name_key IN ({', '.join('?' * len(batch_keys))})",
+                [page_language, page_site, *batch_keys]
+            ).fetchall()
+            for key, revid, date in rows:
+                saved[key] = (revid, self.page_needs_update(datetime.fromisoformat(date)))
+
+        revisions = {}
+        for name, key in keys.items():
+            revision = saved.get(key) or saved.get(aliases.get(key))
+            if revision:
+                revisions[name] = revision
+
+        return revisions
+
+    def touch_pages(self, page_names: list[str], page_language: str, page_site: str) -> None:
+        """Mark saved pages as up to date (as if they were saved now), without changing their content.
+        Pages are matched like in load_page().
+        """
+        sql_touch_page = f"""
+            UPDATE Pages SET datetime = DATETIME('now', 'localtime')
+            WHERE name_key IN (?, {_SQL_ALIAS_TARGET}) AND language = ? AND site = ?
+        """
+        with self.__transaction():
+            self.__db.executemany(
+                sql_touch_page,
+                [(key, key, page_language, page_site, page_language, page_site) for key in { _page_key(name, page_site) for name in page_names }]
+            )
+
+    def save_aliases(self, aliases: dict[str, str], page_language: str, page_site: str) -> None:
+        """Save other names of saved pages, given as a dict of the names pages were requested with and the pages' titles.
+        The wiki takes the names to the titles by normalizing them (e.g. "python" to "Python") and by following redirects.
+
+        If DB_SAVE_PAGES is set to False in config, aliases are not saved.
+        """
+        if config.DB_SAVE_PAGES == False:
+            return None
+
+        rows = []
+        for alias, title in aliases.items():
+            alias_key, name_key = _page_key(alias, page_site), _page_key(title, page_site)
+            if alias_key != name_key:
+                rows.append((alias_key, name_key, page_language, page_site))
+        if not rows:
+            return None
+
+        with self.__transaction():
+            self.__db.executemany(
+                """INSERT INTO PageAliases (alias_key, name_key, language, site, datetime) VALUES (?, ?, ?, ?, DATETIME('now', 'localtime'))
+                ON CONFLICT (alias_key, language, site) DO UPDATE SET name_key = excluded.name_key, datetime = excluded.datetime""",
+                rows
+            )
+
+    def load_page_language(self, page_name: str, page_language: str, page_site: str, language_title: str, include_expired: bool=False) -> WikiPage | None:
+        """Load only one language section of a wiki page from database.
+
+        Constructs a WikiPage object of the language section's text (the section's heading included), without parsing the rest of the page.
+        Language title matching is case insensitive.
+
+        Returns None in the same cases as load_page(), and if the page doesn't have the language section.
+        """
+        if config.DB_USE_SAVED_PAGES == False:
+            return None
+
+        sql_get_page_language = f"""
+            SELECT
+                P.name, P.content, P.language, P.datetime, P.site, P.pageid, P.revid, P.id, P.compression, L.start, L.length
+            FROM
+                Pages P JOIN PageLanguages L ON L.page_id = P.id
+            WHERE
+                P.name_key IN (?, {_SQL_ALIAS_TARGET}) AND P.language = ? AND P.site = ? AND lower(L.title) = lower(?)
+            ORDER BY
+                P.name = ? DESC
+            LIMIT 1
         """
-        page = self.__db.execute(sql_get_page, [page_name, page_language, page_site]).fetchone()
+        key = _page_key(page_name, page_site)
+        page = self.__db.execute(
+            sql_get_page_language,
+            [key, key, page_language, page_site, page_language, page_site, language_title, page_name]
+        ).fetchone()
         if page == None:
             return None
 
-        title, text, language, date, site = page[0], page[1], page[2], datetime.fromisoformat(page[3]), page[4]
+        title, language, date, site = page[0], page[2], datetime.fromisoformat(page[3]), page[4]
 
-        if  self.page_needs_update(date):
+        if  self.page_needs_update(date) and not include_expired:
             return None
         else:
-            return WikiPage(text, title, language, site)
+            # the section is cut out after decompressing, as compressed content can't be sliced in sql
+            content = self.__decode_content(page[1], page[8])
+            text = content[page[9] : page[9] + page[10]]
+            return WikiPage(text, title, language, site, lazy=True, page_id=page[5], rev_id=page[6])
+
+
+
+
+    def save_outline(self, page_name: str, page_language: str, page_site: str, outline: tuple) -> None:
+        """Save a page's outline (see WikiApi.get_outline) to database.
+
+        If DB_SAVE_PAGES is set to False in config, outline is not saved.
+        """
+        if config.DB_SAVE_PAGES == False:
+            return None
+
+        # upserted instead of replaced, so that the update triggers of _add_cache_sizes run
+        sql_upsert_outline = """
+            INSERT INTO PageOutlines (name, language, site, title, pageid, revid, headings, datetime)
+            VALUES (?, ?, ?, ?, ?, ?, ?, DATETIME('now', 'localtime'))
+            ON CONFLICT (name, language, site) DO UPDATE SET
+                title = excluded.title, pageid = excluded.pageid, revid = excluded.revid, headings = excluded.headings, datetime = excluded.datetime
+            RETURNING id
+        """
+        title, page_id, rev_id, headings = outline
+        with self.__transaction():
+            outline_id = self.__db.execute(
+                sql_upsert_outline,
+                [page_name, page_language, page_site, title, page_id, rev_id, json.dumps(headings)]
+            ).fetchone()[0]
+            self.__evict(config.DB_EVICTIONS_PER_WRITE, written_outlines=[outline_id])
+        self.__vacuum(config.DB_VACUUM_PAGES_PER_WRITE)
+
+    def load_outline(self, page_name: str, page_language: str, page_site: str) -> tuple | None:
+        """Load a page's outline from database.
+
+        Returns None in the same cases as load_page().
+        """
+        if config.DB_USE_SAVED_PAGES == False:
+            return None
+
+        outline = self.__db.execute(
+            "SELECT title, pageid, revid, headings, datetime FROM PageOutlines WHERE name = ? AND language = ? AND site = ?",
+            [page_name, page_language, page_site]
+        ).fetchone()
+        if outline == None or self.page_needs_update(datetime.fromisoformat(outline[4])):
+            return None
+
+        headings = [tuple(h) for h in json.loads(outline[3])]
+        return (outline[0], outline[1], outline[2], headings)
+
+    def save_sections(self, page_language: str, page_site: str, rev_id: int, sections: dict[int, str]) -> None:
+        """Save the wikitexts of a page revision's sections, given as a dict of section index and content.
+
+        If DB_SAVE_PAGES is set to False in config, sections are not saved.
+        """
+        if config.DB_SAVE_PAGES == False:
+            return None
+
+        if not sections:
+            return None
+
+        sql_upsert_section = """
+            INSERT INTO PageSections (language, site, revid, section, content, datetime) VALUES (?, ?, ?, ?, ?, DATETIME('now', 'localtime'))
+            ON CONFLICT (revid, section, language, site) DO UPDATE SET content = excluded.content, datetime = excluded.datetime
+        """
+
+        with self.__transaction():
+            self.__db.executemany(sql_upsert_section, [(page_language, page_site, rev_id, index, content) for index, content in sections.items()])
+            # the sections go when the last outline of their revision does, so that's kept too
+            outline_ids = [row[0] for row in self.__db.execute(
+                "SELECT id FROM PageOutlines WHERE revid = ? AND language = ? AND site = ?", [rev_id, page_language, page_site]
+            )]
+            self.__evict(config.DB_EVICTIONS_PER_WRITE, written_outlines=outline_ids)
+        self.__vacuum(config.DB_VACUUM_PAGES_PER_WRITE)
+
+    def load_sections(self, page_language: str, page_site: str, rev_id: int, indices: list[int]) -> dict[int, str]:
+        """Load the saved wikitexts of a page revision's sections.
+
+        Returns a dict of section index and content, of the sections that are saved.
+        """
+        if config.DB_USE_SAVED_PAGES == False or not indices:
+            return {}
+
+        rows = self.__db.execute(
+            f"SELECT section, content FROM PageSections WHERE language = ? AND site = ? AND revid = ? AND section IN ({', '.join('?' * len(indices))})",
+            [page_language, page_site, rev_id, *indices]
+        ).fetchall()
+        return dict(rows)
+
+
+
+
+    def save_failed_search(self, page_name: str, page_language: str, page_site: str) -> None:
+        """Save a search for a page that wasn't found on the wiki, so that it isn't searched from the wiki again for a while.
+        Expired failed searches are removed.
+
+        If DB_SAVE_FAILED_SEARCHES is set to False in config, search is not saved.
+        """
+        if config.DB_SAVE_FAILED_SEARCHES == False:
+            return None
+
+        expiration_time = cfg_parser.expiration_time_to_seconds(config.DB_FAILED_SEARCH_EXPIRATION_TIME)
+        with self.__transaction():
+            self.__db.execute(
+                "INSERT OR REPLACE INTO FailedSearches (name, language, site, datetime) VALUES (?, ?, ?, DATETIME('now', 'localtime'))",
+                [page_name, page_language, page_site]
+            )
+            # expired ones would be searched from the wiki anyway
+            self.__db.execute(
+                "DELETE FROM FailedSearches WHERE datetime < DATETIME('now', 'localtime', ?)", [f"-{int(expiration_time)} seconds"]
+            )
+
+    def is_failed_search(self, page_name: str, page_language: str, page_site: str) -> bool:
+        """Check if a page was recently searched for and not found on the wiki.
+
+        Failed searches expire after DB_FAILED_SEARCH_EXPIRATION_TIME defined in config.
+        """
+        if config.DB_SAVE_FAILED_SEARCHES == False:
+            return False
+
+        search = self.__db.execute(
+            "SELECT datetime FROM FailedSearches WHERE name = ? AND language = ? AND site = ?",
+            [page_name, page_language, page_site]
+        ).fetchone()
+        if search == None:
+            return False
+
+        expiration_time = cfg_parser.expiration_time_to_seconds(config.DB_FAILED_SEARCH_EXPIRATION_TIME)
+        return (datetime.now() - datetime.fromisoformat(search[0])).total_seconds() <= expiration_time
+
+    def remove_failed_search(self, page_name: str, page_language: str, page_site: str) -> None:
+        self.__db.execute(
+            "DELETE FROM FailedSearches WHERE name = ? AND language = ? AND site = ?",
+            [page_name, page_language, page_site]
+        )
+
+    def save_search_results(self, query: str, site: str, lang: str, result_limit: int, results: list[str]) -> None:
+        """Save a search's results to database.
+
+        Only the DB_SEARCH_RESULTS_CACHE_SIZE most recently used searches are kept, the rest are removed.
+        If DB_SAVE_SEARCH_RESULTS is set to False in config, results are not saved.
+        """
+        if config.DB_SAVE_SEARCH_RESULTS == False:
+            return None
+
+        with self.__transaction():
+            self.__db.execute(
+                """INSERT OR REPLACE INTO SearchResults (query, language, site, result_limit, results, datetime, last_used)
+                VALUES (?, ?, ?, ?, ?, DATETIME('now', 'localtime'), DATETIME('now', 'localtime'))""",
+                [_normalize_query(query), lang, site, result_limit, json.dumps(results)]
+            )
+            self.__db.execute(
+                "DELETE FROM SearchResults WHERE id NOT IN (SELECT id FROM SearchResults ORDER BY last_used DESC, id DESC LIMIT ?)",
+                [config.DB_SEARCH_RESULTS_CACHE_SIZE]
+            )
+
+    def load_search_results(self, query: str, site: str, lang: str, result_limit: int) -> list[str] | None:
+        """Load a search's saved results from database.
+
+        Returns None if:
+        - the search's results aren't saved
+        - the results were saved longer than DB_SEARCH_RESULTS_EXPIRATION_TIME defined in config ago
+        - DB_SAVE_SEARCH_RESULTS is set to False in config
+        """
+        if config.DB_SAVE_SEARCH_RESULTS == False:
+            return None
+
+        query = _normalize_query(query)
+        search = self.__db.execute(
+            "SELECT id, results, datetime FROM SearchResults WHERE query = ? AND language = ? AND site = ? AND result_limit = ?",
+            [query, lang, site, result_limit]
+        ).fetchone()
+        if search == None:
+            return None
+
+        expiration_time = cfg_parser.expiration_time_to_seconds(config.DB_SEARCH_RESULTS_EXPIRATION_TIME)
+        if (datetime.now() - datetime.fromisoformat(search[2])).total_seconds() > expiration_time:
+            return None
+
+        self.__db.execute("UPDATE SearchResults SET last_used = DATETIME('now', 'localtime') WHERE id = ?", [search[0]])
+        return json.loads(search[1])
+
+    @contextmanager
+    def fetch_lock(self, page_name: str, page_language: str, page_site: str):
+        """Let only one process at a time get a page from the wiki: the others wait in the with block's beginning,
+        and should then check if the page got saved while they waited.
+
+        Each page has its own lock (a byte of a lock file locked with fcntl), so getting different pages isn't slowed down.
+        If the lock isn't got in DB_FETCH_LOCK_TIMEOUT, e.g. because the other process is stuck, the with block is run anyway.
+        The lock is per process, so threads of the same process don't wait for each other.
+        """
+        if fcntl is None:
+            yield
+            return
+
+        fd = _fetch_lock_fd()
+        offset = zlib.crc32(f"{page_site}\0{page_language}\0{page_name}".encode()) # same in every process, unlike hash()
+        deadline = time.monotonic() + config.DB_FETCH_LOCK_TIMEOUT
+        delay = 0.01
+        locked = False
+        while not locked:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, offset)
+                locked = True
+            except OSError:
+                if time.monotonic() > deadline:
+                    log(f"Another process is still getting \"{page_name}\", getting it anyway.")
+                    break
+                time.sleep(delay)
+                delay = min(delay * 2, 0.2)
+
+        try:
+            yield
+        finally:
+            if locked:
+                fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+
+    def count_cache_lookup(self, cache: str, hit: bool) -> None:
+        """Count a hit or a miss of a lookup from one of the caches in the database, e.g. "pages".
+        """
+        self.__db.execute(
+            """INSERT INTO CacheStats (cache, hits, misses) VALUES (?, ?, ?)
+            ON CONFLICT (cache) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses""",
+            [cache, int(hit), int(not hit)]
+        )
+
+    def get_cache_stats(self) -> list[tuple]:
+        """Get the hit and miss counts of the caches.
+
+        returns a list of tuples with cache, hits and misses.
+        """
+        return self.__db.execute("SELECT cache, hits, misses FROM CacheStats ORDER BY cache ASC").fetchall()
 
 
 
@@ -212,7 +1182,9 @@ class Database():
     def clear_saved_pages(self) -> None:
         """ Remove all pages from database.
         """
-        self.__db.execute("DELETE FROM Searches")
+        self.__db.execute("DELETE FROM Pages")
+        self.__db.execute("DELETE FROM PageAliases")
+        self.__vacuum(None)
         return
 
     def remove_saved_page(self,target) -> None: ...
@@ -222,7 +1194,7 @@ class Database():
 
     def page_needs_update(self, date: datetime) -> bool:
         expiration_time = cfg_parser.expiration_time_to_seconds(config.DB_PAGE_EXPIRATION_TIME)
-        cur_page_archival_time = (datetime.now() - date).seconds
+        cur_page_archival_time = (datetime.now() - date).total_seconds()
 
         if cur_page_archival_time > expiration_time:
             return True
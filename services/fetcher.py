@@ -0,0 +1,122 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+
+import tools.config as config
+from tools.logger import log
+from services.wiki_api import WikiApi
+
+class TokenBucket:
+    """Rate limiter allowing 'rate' requests per second on average, and bursts of up to 'burst' requests.
+    """
+    def __init__(self, rate: float, burst: int) -> 'TokenBucket':
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = burst
+        self.__updated = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take a token, waiting until one is available.
+        """
+        while True:
+            with self.__lock:
+                now = time.monotonic()
+                self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+                self.__updated = now
+                if self.__tokens >= 1:
+                    self.__tokens -= 1
+                    return
+                wait = (1 - self.__tokens) / self.__rate
+            time.sleep(wait)
+
+
+class Fetcher:
+    """Gets pages from wikis concurrently, in a pool of threads.
+
+    Titles are requested in batches (see WikiApi.get_pages).
+    Each host (e.g. en.wiktionary.org) gets at most FETCH_MAX_CONNECTIONS_PER_HOST requests at a time
+    and FETCH_REQUESTS_PER_SECOND requests per second, to be polite to the wikis.
+    A title that is already being fetched isn't requested again: the later request waits for the first one's result.
+    """
+    def __init__(self) -> 'Fetcher':
+        self.__max_per_host = config.FETCH_MAX_CONNECTIONS_PER_HOST
+        self.__rate = config.FETCH_REQUESTS_PER_SECOND
+        self.__pool = ThreadPoolExecutor(max_workers=config.FETCH_MAX_WORKERS)
+        self.__lock = threading.Lock()
+        self.__hosts = {}      # host: (semaphore, token bucket)
+        self.__in_flight = {}  # (language, site, title): Future of the page
+
+    def __host_limits(self, language: str, site: str) -> tuple[threading.Semaphore, TokenBucket]:
+        host = f"{language}.{site}"
+        with self.__lock:
+            if host not in self.__hosts:
+                self.__hosts[host] = (threading.Semaphore(self.__max_per_host), TokenBucket(self.__rate, self.__max_per_host))
+            return self.__hosts[host]
+
+    def __fetch_batch(self, language: str, site: str, titles: list[str], futures: dict[str, Future]) -> None:
+        semaphore, bucket = self.__host_limits(language, site)
+        try:
+            with semaphore:
+                bucket.acquire()
+                log(f"Fetching {len(titles)} pages from {language}.{site}.")
+                for title, page in WikiApi(language, site).get_pages(titles):
+                    futures[title].set_result(page)
+        except BaseException as e:
+            for title in titles:
+                if not futures[title].done():
+                    futures[title].set_exception(e)
+        finally:
+            # titles the wiki didn't answer about
+            for title in titles:
+                if not futures[title].done():
+                    futures[title].set_result(None)
+            with self.__lock:
+                for title in titles:
+                    self.__in_flight.pop((language, site, title), None)
+
+    def submit(self, language: str, site: str, titles: list[str]) -> dict[str, Future]:
+        """Start getting the pages for titles.
+
+        Returns a dict of the titles and futures of their WikiPages (None for pages not found).
+        """
+        futures = {}
+        new_titles = []
+        with self.__lock:
+            for title in dict.fromkeys(titles):
+                key = (language, site, title)
+                if key not in self.__in_flight:
+                    self.__in_flight[key] = Future()
+                    new_titles.append(title)
+                futures[title] = self.__in_flight[key]
+
+        batch_size = config.WIKI_QUERY_TITLES_LIMIT
+        for i in range(0, len(new_titles), batch_size):
+            batch = new_titles[i : i + batch_size]
+            self.__pool.submit(self.__fetch_batch, language, site, batch, futures)
+
+        return futures
+
+    def fetch(self, language: str, site: str, titles: list[str], progress: callable=None):
+        """Get the pages for titles concurrently.
+
+        Yields tuples of title, WikiPage (None if not found or failed) and the exception getting the page failed with (None if it didn't),
+        in the order the pages are got. A failed request fails only the titles that were in it.
+        progress is called with the number of titles done and the number of all titles after each title.
+        """
+        futures = self.submit(language, site, titles)
+        titles_by_future = {}
+        for title, future in futures.items():
+            titles_by_future.setdefault(future, []).append(title)
+
+        done = 0
+        for future in as_completed(titles_by_future):
+            for title in titles_by_future[future]:
+                done += 1
+                if progress:
+                    progress(done, len(futures))
+                error = future.exception()
+                yield (title, future.result() if error is None else None, error)
+
+    def close(self) -> None:
+        self.__pool.shutdown(wait=True)
@@ -0,0 +1,99 @@
+import bz2
+import time
+import xml.etree.ElementTree as ET
+
+import tools.config as config
+from tools.logger import log
+from tools.wikiparser import WikiPage
+
+class DumpStats:
+    """Counts of what has been read from a dump so far.
+    """
+    def __init__(self) -> 'DumpStats':
+        self.started = time.monotonic()
+        self.pages_read = 0
+        self.pages_kept = 0
+        self.bytes_read = 0 # of xml, i.e. uncompressed
+
+    @property
+    def elapsed(self) -> float:
+        return max(time.monotonic() - self.started, 1e-9)
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages_read / self.elapsed
+    @property
+    def megabytes_per_second(self) -> float:
+        return self.bytes_read / 1e6 / self.elapsed
+
+
+def _local_name(tag: str) -> str:
+    """Tag name without the xml namespace, e.g. "{http://www.mediawiki.org/xml/export-0.10/}page" -> "page"
+    """
+    return tag.rsplit("}", 1)[-1]
+
+def _child_text(elem: ET.Element, name: str) -> str | None:
+    for c in elem:
+        if _local_name(c.tag) == name:
+            return c.text
+    return None
+
+def _child(elem: ET.Element, name: str) -> ET.Element | None:
+    for c in elem:
+        if _local_name(c.tag) == name:
+            return c
+    return None
+
+def read_dump(dump_path: str, language: str, site: str, stats: DumpStats, language_title: str=None):
+    """Read pages from a MediaWiki XML dump (.xml or .xml.bz2), one page at a time.
+
+    Yields WikiPages of the pages in namespaces DUMP_IMPORT_NAMESPACES, skipping redirects.
+    If language_title is given, only pages with a language (level 2) section of that title are yielded,
+    with only that section's text.
+    Each page's elements are freed when it's been read, so memory use doesn't grow with the dump's size.
+    """
+    namespaces = { str(ns) for ns in config.DUMP_IMPORT_NAMESPACES }
+    raw_file = open(dump_path, "rb")
+    dump_file = bz2.BZ2File(raw_file) if dump_path.endswith(".bz2") else raw_file
+
+    try:
+        root = None
+        for event, elem in ET.iterparse(dump_file, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event != "end" or _local_name(elem.tag) != "page":
+                continue
+
+            stats.pages_read += 1
+            stats.bytes_read = dump_file.tell()
+            page = _read_page(elem, namespaces, language, site, language_title)
+            # free the page's elements
+            elem.clear()
+            root.clear()
+
+            if page is not None:
+                stats.pages_kept += 1
+                yield page
+    finally:
+        dump_file.close()
+        raw_file.close()
+
+def _read_page(elem: ET.Element, namespaces: set[str], language: str, site: str, language_title: str | None) -> WikiPage | None:
+    if _child_text(elem, "ns") not in namespaces or _child(elem, "redirect") is not None:
+        return None
+
+    revision = _child(elem, "revision")
+    if revision is None:
+        return None
+    title = _child_text(elem, "title")
+    text = _child_text(revision, "text") or ""
+    page_id = int(_child_text(elem, "id"))
+    rev_id = int(_child_text(revision, "id"))
+
+    if language_title is not None:
+        spans = [(start, end) for t, start, end in WikiPage(text, title, language, site, lazy=True).language_spans() if t.lower() == language_title.lower()]
+        if not spans:
+            return None
+        start, end = spans[0]
+        text = text[start : end]
+
+    return WikiPage(text, title, language, site, lazy=True, page_id=page_id, rev_id=rev_id)
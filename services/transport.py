@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tools.config as config
+from tools.logger import log
+
+# Responses that are worth retrying after a while
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    """Return the HTTP session shared by everything in this process.
+
+    The session keeps connections to each host alive in a pool, so that later requests skip DNS lookups and TCP/TLS handshakes.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            # retries are done in get(), to be able to back off and honor Retry-After
+            adapter = HTTPAdapter(pool_connections=config.HTTP_POOL_SIZE, pool_maxsize=config.HTTP_POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "User-Agent": config.HTTP_USER_AGENT,
+                "Accept-Encoding": "gzip, deflate",
+            })
+            _session = session
+
+        return _session
+
+def close_session() -> None:
+    """Close the shared session's connections. A new session is created when one is needed again.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def get(url: str, params: dict) -> requests.Response:
+    """Send a GET request with the shared session.
+
+    Params are URL encoded into the url's query string.
+    Requests that fail to connect or time out, and responses with a status in RETRY_STATUSES, are retried HTTP_RETRIES times,
+    waiting longer (with some randomness) after each try, or as long as the server asks for with a Retry-After header.
+    If the server asks to wait longer than HTTP_MAX_RETRY_AFTER, its response is returned without retrying.
+
+    Returns the last response, even if it's an error response.
+    Raises the requests exception if the last try couldn't get a response.
+    """
+    session = get_session()
+    for attempt in range(config.HTTP_RETRIES + 1):
+        last_attempt = attempt == config.HTTP_RETRIES
+        try:
+            resp = session.get(url, params=params, timeout=config.HTTP_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if last_attempt:
+                raise e
+            log(f"Request to {url} failed ({e.__class__.__name__}), retrying.")
+            time.sleep(_backoff(attempt))
+            continue
+
+        log(f"GET {resp.url} -> {resp.status_code}, {len(resp.content)} bytes, encoding: {resp.headers.get('Content-Encoding', 'none')}")
+
+        if resp.status_code not in RETRY_STATUSES or last_attempt:
+            return resp
+
+        delay = _retry_after(resp)
+        if delay is None:
+            delay = _backoff(attempt)
+        elif delay > config.HTTP_MAX_RETRY_AFTER:
+            log(f"Got status {resp.status_code}, not retrying as the server asks to wait {delay:.2f}s.")
+            return resp
+        log(f"Got status {resp.status_code}, retrying in {delay:.2f}s.")
+        time.sleep(delay)
+
+def _backoff(attempt: int) -> float:
+    """Time to wait before retrying after the attempt'th try: a random time up to an exponentially growing limit ("full jitter").
+    """
+    return random.uniform(0, min(config.HTTP_MAX_BACKOFF, config.HTTP_BACKOFF * 2 ** attempt))
+
+def _retry_after(resp: requests.Response) -> float | None:
+    """Seconds to wait that the response's Retry-After header asks for, if it has one.
+    The header can be either a number of seconds or an HTTP date.
+    """
+    value = resp.headers.get("Retry-After")
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
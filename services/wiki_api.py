@@ -1,9 +1,13 @@
-import requests
 import json
+import re
+import html
 from tools.logger import log
 
+import services.transport as transport
+
 import tools.languages as languages
 import tools.config as config
+from tools.wikiparser import WikiPage
 
 class WikiApi:
     def __init__(self, language: str, site: str):
@@ -23,14 +27,26 @@ class WikiApi:
             raise ValueError(f'unsupported language "{language}"')
         self.__language = language
 
-        self.__base_url = self.__form_base_url(self.__language, self.__site)
+        self.__api_url = self.__form_api_url(self.__language, self.__site)
 
         self.__cookies = []
+        self.__last_error = None
+
+    @property
+    def last_error(self) -> str | None:
+        """Code of the error the wiki returned for the last request that failed, e.g. "missingtitle" when a page doesn't exist.
+        """
+        return self.__last_error
 
-    def __form_base_url(self, language: str, site: str):
-        url = f"https://{language}.{site}.org/w/api.php?format=json"
+    def __form_api_url(self, language: str, site: str):
+        url = config.WIKI_API_URL.format(language=language, site=site)
         return url
 
+    def __get(self, params: dict):
+        """Send a request with the given params to the wiki's API, using the process' shared HTTP session.
+        """
+        return transport.get(self.__api_url, {"format": "json", **params})
+
     def search(self, search_word: str) -> list:
         """Does a search on wiki and returns the results in a list.
 
@@ -40,36 +56,182 @@ class WikiApi:
         if not 1 <= result_limit <= 500:
             raise ValueError("WIKI_SEARCH_RESULTS_LIMIT must be between 1 and 500.")
 
-        search_url = self.__base_url + "&action=opensearch" + "&search=" + search_word + "&limit=" + str(result_limit) + "&profile=fuzzy"
-        req = requests.get(search_url)
+        req = self.__get({"action": "opensearch", "search": search_word, "limit": result_limit, "profile": "fuzzy"})
         result_json = json.loads(req.text)
         search_results = result_json[1]
         return search_results
 
 
-    def get_page(self, page_name: str) -> tuple[str, str, str]:
-        """Get a wiki page's title, id and text content by page name.
+    def get_page(self, page_name: str) -> tuple[str, int, int, str]:
+        """Get a wiki page's title, id, revision id and text content by page name.
 
-        If page is found, returns a tuple with title, pageid and wikitext.
+        If page is found, returns a tuple with title, pageid, revid and wikitext.
         If page not found, returns None.
         """
-        url = self.__base_url + "&action=parse" + "&page=" + page_name + "&prop=wikitext"
-        req = requests.get(url)
+        # redirects are followed, so that e.g. "Python language" gets the page "Python (programming language)"
+        req = self.__get({"action": "parse", "page": page_name, "prop": "wikitext", "redirects": "1"})
         try:
             resp_json = json.loads(req.text)["parse"]
 
             title = resp_json["title"]
             pageid = resp_json["pageid"]
+            revid = resp_json.get("revid")
             wikitext = resp_json["wikitext"]["*"]
-            return (title, pageid, wikitext)
+            return (title, pageid, revid, wikitext)
 
         except KeyError:
             resp_json = json.loads(req.text)["error"]
             error_code = resp_json["code"]
+            self.__last_error = error_code
             error_info = resp_json["info"]
             log("Error in wiki_api.get_page:", error_code)
             log("Error in wiki_api.get_page:", error_info)
             return None
 
+    def get_outline(self, page_name: str) -> tuple[str, int, int, list[tuple[int, str, str]]] | None:
+        """Get the outline of a wiki page, i.e. its section headings, without its content.
+
+        If page is found, returns a tuple with title, pageid, revid and a list of the page's headings in order,
+        each a tuple of heading level (2 for "==Title=="), title and the heading's section index in the wiki.
+        If page not found, returns None.
+        """
+        req = self.__get({"action": "parse", "page": page_name, "prop": "sections|revid", "redirects": "1", "formatversion": "2"})
+        resp_json = json.loads(req.text)
+        if "parse" not in resp_json:
+            self.__last_error = resp_json["error"]["code"]
+            log("Error in wiki_api.get_outline:", resp_json["error"]["code"])
+            log("Error in wiki_api.get_outline:", resp_json["error"]["info"])
+            return None
+
+        parse = resp_json["parse"]
+        headings = []
+        for s in parse["sections"]:
+            # titles can contain html, e.g. <i>title</i>
+            title = html.unescape(re.sub("<[^>]*>", "", s["line"]))
+            headings.append((int(s["level"]), title, s["index"]))
 
+        return (parse["title"], parse["pageid"], parse.get("revid"), headings)
 
+    def get_section(self, rev_id: int, section_index: str) -> str | None:
+        """Get the wikitext of one section of a page's revision, the section's heading and subsections included.
+
+        Returns None if the revision or section is not found.
+        """
+        req = self.__get({"action": "parse", "oldid": rev_id, "section": section_index, "prop": "wikitext", "formatversion": "2"})
+        resp_json = json.loads(req.text)
+        if "parse" not in resp_json:
+            log("Error in wiki_api.get_section:", resp_json["error"]["code"])
+            log("Error in wiki_api.get_section:", resp_json["error"]["info"])
+            return None
+
+        return resp_json["parse"]["wikitext"]
+
+    def get_pages(self, titles: list[str]):
+        """Get many wiki pages, WIKI_QUERY_TITLES_LIMIT pages per request.
+
+        Yields a tuple of each requested title and the WikiPage for it, as soon as the request the title was in is done.
+        The page's title can differ from the requested title if the title was normalized (e.g. "word_a" -> "Word a" on wikipedia) or redirected.
+        If a page is not found, yields None in place of the WikiPage.
+        Duplicate titles are requested and yielded only once.
+        """
+        batch_size = config.WIKI_QUERY_TITLES_LIMIT
+        if not 1 <= batch_size <= 500:
+            raise ValueError("WIKI_QUERY_TITLES_LIMIT must be between 1 and 500.")
+
+        titles = list(dict.fromkeys(titles))
+        for i in range(0, len(titles), batch_size):
+            batch = titles[i : i + batch_size]
+            pages = self.__query_pages(batch)
+            for title, page_info in pages.items():
+                if page_info is None:
+                    yield (title, None)
+                else:
+                    page_title, page_id, rev_id, wikitext = page_info
+                    yield (title, WikiPage(wikitext, page_title, self.__language, self.__site, lazy=True, page_id=page_id, rev_id=rev_id))
+
+    def __query_pages(self, titles: list[str]) -> dict[str, tuple | None]:
+        """Get the latest revisions of pages in one query (and its continuations, if the response doesn't fit in one).
+
+        Returns a dict of the requested titles and tuples of page title, pageid, revid and wikitext (None for pages not found).
+        """
+        params = {
+            "action": "query",
+            "prop": "revisions",
+            "rvprop": "content|ids",
+            "rvslots": "main",
+            "formatversion": "2",
+            "redirects": "1",
+            "titles": "|".join(titles),
+        }
+
+        renames = {}  # titles normalized and redirected by the wiki
+        found = {}
+        continue_params = {}
+        while True:
+            req = self.__get({**params, **continue_params})
+            resp_json = json.loads(req.text)
+            if "error" in resp_json:
+                log("Error in wiki_api.get_pages:", resp_json["error"]["code"])
+                log("Error in wiki_api.get_pages:", resp_json["error"]["info"])
+                break
+
+            query = resp_json.get("query", {})
+            for r in query.get("normalized", []) + query.get("redirects", []):
+                renames[r["from"]] = r["to"]
+
+            for p in query.get("pages", []):
+                if p.get("missing") or p.get("invalid") or not p.get("revisions"):
+                    continue
+                rev = p["revisions"][0]
+                found[p["title"]] = (p["title"], p["pageid"], rev["revid"], rev["slots"]["main"]["content"])
+
+            if "continue" not in resp_json:
+                break
+            continue_params = resp_json["continue"]
+
+        return self.__map_requested_titles(titles, renames, found)
+
+    def get_revision_ids(self, titles: list[str]) -> dict[str, tuple[str, int, int] | None]:
+        """Get the ids of the latest revisions of many pages, without their content, WIKI_QUERY_TITLES_LIMIT pages per request.
+
+        Returns a dict of the requested titles and tuples of page title, pageid and revid (None for pages not found).
+        Titles are normalized and redirected like in get_pages.
+        """
+        batch_size = config.WIKI_QUERY_TITLES_LIMIT
+        if not 1 <= batch_size <= 500:
+            raise ValueError("WIKI_QUERY_TITLES_LIMIT must be between 1 and 500.")
+
+        titles = list(dict.fromkeys(titles))
+        revisions = {}
+        for i in range(0, len(titles), batch_size):
+            batch = titles[i : i + batch_size]
+            req = self.__get({"action": "query", "prop": "info", "formatversion": "2", "redirects": "1", "titles": "|".join(batch)})
+            resp_json = json.loads(req.text)
+            if "error" in resp_json:
+                log("Error in wiki_api.get_revision_ids:", resp_json["error"]["code"])
+                log("Error in wiki_api.get_revision_ids:", resp_json["error"]["info"])
+                revisions.update({ t : None for t in batch })
+                continue
+
+            query = resp_json.get("query", {})
+            renames = { r["from"] : r["to"] for r in query.get("normalized", []) + query.get("redirects", []) }
+            found = {
+                p["title"] : (p["title"], p["pageid"], p["lastrevid"])
+                for p in query.get("pages", []) if not p.get("missing") and not p.get("invalid")
+            }
+            revisions.update(self.__map_requested_titles(batch, renames, found))
+
+        return revisions
+
+    def __map_requested_titles(self, titles: list[str], renames: dict[str, str], found: dict[str, tuple]) -> dict[str, tuple | None]:
+        """Map requested titles to what was found for them, following the wiki's normalizations and redirects of the titles.
+        """
+        pages = {}
+        for requested in titles:
+            title = requested
+            seen = set()
+            while title in renames and title not in seen:
+                seen.add(title)
+                title = renames[title]
+            pages[requested] = found.get(title)
+        return pages
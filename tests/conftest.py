@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+import pytest
+
+# the modules are imported the way main.py imports them, from the repository's root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import options
+import services.db as db
+
+
+@pytest.fixture(autouse=True)
+def default_options(monkeypatch):
+    """The options of a run without command line options (see options.init).
+    """
+    for name, value in {
+        "DO_FORMATTING": True,
+        "DO_SEARCH": False,
+        "FORCE_WEB": False,
+        "VERBOSE": False,
+        "COMPACT": False,
+        "BULK": False,
+        "IMPORT": False,
+        "PREFETCH": False,
+    }.items():
+        monkeypatch.setattr(options, name, value, raising=False)
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A Database in an empty directory instead of the user's, with nothing of other tests' databases kept in memory.
+    The directory is under HOME, which processes started by the test get too.
+    """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(db, "_local", threading.local())
+    monkeypatch.setattr(db, "_fetch_lock_file", None)
+    monkeypatch.setattr(db, "_zdicts", {})
+    monkeypatch.setattr(db, "_zdict_checks", Counter())
+    return db.Database()
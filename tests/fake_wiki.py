@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def page_text(title: str) -> str:
+    return f"==English==\n===Noun===\n# {title} definition\n" + "x" * 20000
+
+
+class FakeWiki(ThreadingHTTPServer):
+    """A MediaWiki API, at api_url, that has a page for every title but the missing ones, answering after latency seconds.
+    Requests with failing titles get a 500 response that isn't from the API, as from a proxy in front of it.
+
+    Keeps count of the pages got by title, of the requests being answered at a time by wiki (e.g. "en/wiktionary"),
+    and of when the requests were got.
+    """
+    daemon_threads = True
+
+    def __init__(self, latency: float=0.0, missing: set[str]=(), failing: set[str]=()):
+        super().__init__(("127.0.0.1", 0), _FakeWikiHandler)
+        self.latency = latency
+        self.missing = set(missing)
+        self.failing = set(failing)
+        self.page_requests = Counter()
+        self.active = Counter()
+        self.max_active = Counter()
+        self.request_times = []
+        self.lock = threading.Lock()
+
+    @property
+    def api_url(self) -> str:
+        return "http://127.0.0.1:%d/{language}/{site}/api.php" % self.server_address[1]
+
+    def start(self) -> 'FakeWiki':
+        threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def _pages(self, titles: list[str]) -> list[dict]:
+        pages = []
+        for title in titles:
+            if title in self.missing:
+                pages.append({"ns": 0, "title": title, "missing": True})
+            else:
+                revision = {"revid": 1, "slots": {"main": {"content": page_text(title)}}}
+                pages.append({"pageid": zlib.crc32(title.encode()), "ns": 0, "title": title, "lastrevid": 1, "revisions": [revision]})
+        return pages
+
+    def _parse(self, title: str) -> dict:
+        if title in self.missing:
+            return {"error": {"code": "missingtitle", "info": "The page you specified doesn't exist."}}
+        return {"parse": {"title": title, "pageid": zlib.crc32(title.encode()), "revid": 1, "wikitext": {"*": page_text(title)}}}
+
+
+class _FakeWikiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        wiki = self.server
+        url = urlparse(self.path)
+        host = url.path.rsplit("/", 1)[0]
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        titles = params["titles"].split("|") if "titles" in params else [params["page"]] if "page" in params else []
+
+        with wiki.lock:
+            wiki.request_times.append(time.monotonic())
+            wiki.page_requests.update(titles)
+            wiki.active[host] += 1
+            wiki.max_active[host] = max(wiki.max_active[host], wiki.active[host])
+        try:
+            time.sleep(wiki.latency)
+            if wiki.failing.intersection(titles):
+                self.__respond(500, None)
+            elif params.get("action") == "query":
+                self.__respond(200, {"query": {"pages": wiki._pages(titles)}})
+            elif params.get("action") == "parse":
+                self.__respond(200, wiki._parse(titles[0]))
+            else:
+                # searches for suggestions
+                self.__respond(200, [params.get("search", ""), [], [], []])
+        finally:
+            with wiki.lock:
+                wiki.active[host] -= 1
+
+    def __respond(self, status: int, response) -> None:
+        data = b"Internal Server Error" if response is None else json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
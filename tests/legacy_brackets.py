@@ -0,0 +1,71 @@
+"""The recursive bracket matcher that tools.parsing_utils.find_bracketed_strings replaced, kept as the reference it's tested against.
+"""
+from collections import namedtuple
+
+Bracket = namedtuple('Bracket', ['pos', 'str'])
+
+
+def _find_brackets(text: str, starting_bracket: str, ending_bracket: str) -> list[Bracket]:
+    brackets = []
+    for char_i in range(len(text)):
+        if text[char_i : char_i + len(starting_bracket)] == starting_bracket:
+            brackets.append(Bracket(char_i, starting_bracket))
+        elif text[char_i : char_i + len(ending_bracket)] == ending_bracket:
+            brackets.append(Bracket(char_i, ending_bracket))
+    return brackets
+
+
+def _is_overlapping(b1: Bracket, b2: Bracket) -> bool:
+    b1_right_pos = b1.pos + len(b1.str) - 1
+    b2_right_pos = b2.pos + len(b2.str) - 1
+    return b2.pos <= b1_right_pos <= b2_right_pos or b1.pos <= b2_right_pos <= b1_right_pos
+
+
+def _get_matching_brackets(brackets, opening_bracket_str, closing_bracket_str, _used=None, _pairs=None, _pointer=0, _has_no_pair=None):
+    if _pairs is None:
+        _pairs = []
+    if _used is None:
+        _used = {b: False for b in brackets}
+    if _has_no_pair is None:
+        _has_no_pair = {b: False for b in brackets}
+
+    ending_pair = None
+    starting_pair = brackets[_pointer] if _pointer < len(brackets) else None
+    for cur_pointer in range(_pointer, len(brackets)):
+        bracket = brackets[cur_pointer]
+        if _used[bracket] or _has_no_pair[bracket]:
+            continue
+
+        if bracket.str == closing_bracket_str:
+            ending_pair = bracket
+            break
+
+        if bracket.str == opening_bracket_str:
+            starting = bracket
+            _, ending = _get_matching_brackets(brackets, opening_bracket_str, closing_bracket_str, _used, _pairs, cur_pointer + 1, _has_no_pair)
+            if ending is not None and not _used[starting] and not _used[ending]:
+                _pairs.append(starting)
+                _pairs.append(ending)
+                _used[starting] = True
+                _used[ending] = True
+                for b in brackets:
+                    if _is_overlapping(ending, b): _used[b] = True
+                    if _is_overlapping(starting, b): _used[b] = True
+
+    if not ending_pair and starting_pair:
+        _has_no_pair[starting_pair] = True
+    return _pairs, ending_pair
+
+
+def find_bracketed_strings(text: str, starting_bracket: str, ending_bracket: str) -> list:
+    br_spans = []
+    brackets = _find_brackets(text, starting_bracket, ending_bracket)
+    if starting_bracket == ending_bracket:
+        for i in range(0, len(brackets) - 1, 2):
+            br_spans.append((brackets[i].pos, brackets[i + 1].pos + len(brackets[i + 1].str)))
+    else:
+        matching_brackets, _ = _get_matching_brackets(brackets, starting_bracket, ending_bracket)
+        for i in range(0, len(matching_brackets), 2):
+            br_spans.append((matching_brackets[i].pos, matching_brackets[i + 1].pos + len(matching_brackets[i + 1].str)))
+
+    return [(text[start:end], (start, end)) for start, end in br_spans]
@@ -0,0 +1,67 @@
+"""The section splitting and tree building of tools.wikiparser.WikiPage before sections were built in one pass (WikiPage.__build_section_tree)
+and held spans of the page's text instead of their contents, kept as the reference they're tested against.
+
+Sections are (title, number, content, children) tuples.
+"""
+import re
+
+
+def _section(title: str, content: str, number: int) -> list:
+    return [title.replace("=", "").replace("}", "").replace("{", "").strip(), number, content, []]
+
+
+def _get_children(section_tuples: list, child_depth: int=1, _sect_num: int=1) -> list:
+    children = []
+    i = 0
+    while i < len(section_tuples):
+        sect_title = section_tuples[i][0]
+        cur_depth = int(sect_title.count("=") / 2)
+
+        if cur_depth == child_depth:
+            child_sect = _section(sect_title, section_tuples[i][1], _sect_num)
+            section_tuples.pop(0)
+            child_sect[3] = _get_children(section_tuples, child_depth + 1)
+            children.append(child_sect)
+            i -= 1
+
+        elif cur_depth == child_depth - 1:
+            break
+
+        _sect_num += 1
+        i += 1
+
+    return children
+
+
+def split_into_sections(text: str, page_title: str) -> tuple:
+    """The page's root section, with every section's content sliced from text.
+    """
+    section_spans = [(0, 0)] + [m.span() for m in re.finditer("^=+" + "[^=]+" + "=+$", text, re.MULTILINE)]
+
+    titles = ["=" + page_title + "="]
+    for start, end in section_spans:
+        title = text[start:end]
+        if title != '':
+            titles.append(title.strip())
+
+    sections = []
+    for s_i in range(0, len(section_spans)):
+        start = section_spans[s_i][1]
+        if s_i + 1 >= len(section_spans):
+            section_content = text[start:]
+        else:
+            section_content = text[start : section_spans[s_i + 1][0]].strip()
+        sections.append((titles[s_i].strip(), section_content))
+
+    return _freeze(_get_children(sections)[0])
+
+
+def _freeze(section: list) -> tuple:
+    title, number, content, children = section
+    return (title, number, content, tuple(_freeze(child) for child in children))
+
+
+def as_tuples(section) -> tuple:
+    """A tools.wikiparser.Section and the sections under it as (title, number, content, children) tuples.
+    """
+    return (section.title, section.number, section.content, tuple(as_tuples(child) for child in section.children))
@@ -0,0 +1,68 @@
+import random
+import time
+
+import pytest
+
+import legacy_brackets
+from tools.parsing_utils import find_bracketed_strings
+
+BRACKET_PAIRS = [
+    ("{{", "}}"),
+    ("[[", "]]"),
+    ("'''", "'''"),
+    ("''", "''"),
+    ("<ref", "</ref>"),
+    ("<ref", "/>"),
+    ("<code", "</code>"),
+    ("<code", "/>"),
+]
+
+# pieces of text that make up the brackets, and parts of them
+PIECES = ["{", "}", "[", "]", "'", "x", " ", "<ref", "</ref>", "/>", "<code", "</code>", "<", "/", ">"]
+
+SAMPLE_LINES = (
+    "# {{lb|en|transitive}} To [[put]] something {{l|en|in {{m|en|place}}}}, '''bold''' and ''italic''.<ref>x</ref>\n"
+    "#: {{ux|en|He [[set]] the table.}}<ref name=\"a\"/>\n"
+)
+
+
+@pytest.mark.parametrize("starting_bracket, ending_bracket", BRACKET_PAIRS)
+def test_same_spans_as_legacy_matcher(starting_bracket, ending_bracket):
+    rng = random.Random(starting_bracket + ending_bracket)
+    for _ in range(3000):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 25)))
+        assert find_bracketed_strings(text, starting_bracket, ending_bracket) == \
+            legacy_brackets.find_bracketed_strings(text, starting_bracket, ending_bracket), text
+
+
+def test_nested_and_overlapping_brackets():
+    assert find_bracketed_strings("{{a{{b}}c}}", "{{", "}}") == [("{{b}}", (3, 8)), ("{{a{{b}}c}}", (0, 11))]
+    # the extra bracket of a triple one isn't matched again
+    assert find_bracketed_strings("{{{a}}}", "{{", "}}") == legacy_brackets.find_bracketed_strings("{{{a}}}", "{{", "}}")
+    assert find_bracketed_strings("'''b''' ''i''", "'''", "'''") == [("'''b'''", (0, 7))]
+    assert find_bracketed_strings("a<ref name=x/>b", "<ref", "/>") == [("<ref name=x/>", (1, 14))]
+    assert find_bracketed_strings("}}{{a}}", "{{", "}}") == []
+
+
+def _matching_time(text: str) -> float:
+    """Fastest of a few runs, as the others are mostly noise.
+    """
+    times = []
+    for _ in range(3):
+        start = time.perf_counter()
+        find_bracketed_strings(text, "{{", "}}")
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def test_scales_linearly():
+    """Matching 1 MB takes about 1024 times as long as 1 KB, instead of about a million times as it would if quadratic.
+    """
+    times = {}
+    for size in [1 << 10, 1 << 14, 1 << 16, 1 << 18, 1 << 20]:
+        text = (SAMPLE_LINES * (size // len(SAMPLE_LINES) + 1))[:size]
+        times[size] = _matching_time(text)
+        print(f"{size // 1024:5d} KB: {times[size] * 1000:8.2f} ms")
+
+    # 16 times the text, with leeway for timing noise
+    assert times[1 << 20] < times[1 << 16] * 16 * 3
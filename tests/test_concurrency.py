@@ -0,0 +1,66 @@
+import io
+import multiprocessing
+import random
+from collections import Counter
+from contextlib import redirect_stdout
+
+import pytest
+
+from fake_wiki import FakeWiki
+
+PROCESSES = 12
+TITLES = [f"word{i}" for i in range(12)]
+MISSING_TITLES = ["missing0", "missing1"]
+
+
+def _look_up(args: tuple) -> list[tuple[str, str]]:
+    """Look up titles like a "wiktionary d <title> Noun" process would, in a process of its own.
+    Returns the titles whose lookup failed, and why.
+    """
+    api_url, titles = args
+    from tools import options
+    import tools.config as config
+    from services import commands
+
+    config.WIKI_API_URL = api_url
+    for name, value in {"DO_FORMATTING": True, "FORCE_WEB": False, "VERBOSE": False, "COMPACT": False, "PREFETCH": False}.items():
+        setattr(options, name, value)
+
+    errors = []
+    for title in titles:
+        output = io.StringIO()
+        try:
+            with redirect_stdout(output):
+                commands.fetch_wiki_page(title, "en", "Noun", "wiktionary")
+        except Exception as e:
+            errors.append((title, repr(e)))
+            continue
+        if title not in MISSING_TITLES and f"{title} definition" not in output.getvalue():
+            errors.append((title, output.getvalue()[:200]))
+    return errors
+
+
+@pytest.fixture
+def wiki():
+    server = FakeWiki(latency=0.05, missing=MISSING_TITLES).start()
+    yield server
+    server.stop()
+
+
+def test_parallel_processes_share_the_page_cache(database, wiki):
+    """Many processes look up the same pages at once, as scripts running lookups through xargs -P do.
+    None of the lookups fail (e.g. with "database is locked"), and each page is got from the wiki only once.
+    """
+    api_url = wiki.api_url
+    jobs = []
+    for i in range(PROCESSES):
+        titles = TITLES + MISSING_TITLES
+        random.Random(i).shuffle(titles)
+        jobs.append((api_url, titles))
+
+    # spawned, like separate CLI processes, instead of forked with the parent's connections
+    with multiprocessing.get_context("spawn").Pool(PROCESSES) as pool:
+        errors = [error for process_errors in pool.map(_look_up, jobs) for error in process_errors]
+
+    assert errors == []
+    assert wiki.page_requests == Counter(TITLES + MISSING_TITLES)
@@ -0,0 +1,121 @@
+import time
+
+import pytest
+
+import tools.config as config
+from fake_wiki import FakeWiki, page_text
+from services import commands, transport
+from services.fetcher import Fetcher, TokenBucket
+
+
+@pytest.fixture
+def wiki(monkeypatch):
+    server = FakeWiki(latency=0.05, missing={"missing"}, failing={"broken"}).start()
+    monkeypatch.setattr(config, "WIKI_API_URL", server.api_url)
+    # failing requests aren't retried
+    monkeypatch.setattr(config, "HTTP_RETRIES", 0)
+    monkeypatch.setattr(config, "FETCH_MAX_WORKERS", 8)
+    monkeypatch.setattr(config, "FETCH_MAX_CONNECTIONS_PER_HOST", 2)
+    monkeypatch.setattr(config, "FETCH_REQUESTS_PER_SECOND", 1000)
+    yield server
+    server.stop()
+    transport.close_session()
+
+
+def _fetch(titles: list[str], language: str="en") -> dict:
+    fetcher = Fetcher()
+    try:
+        return {title: (page, error) for title, page, error in fetcher.fetch(language, "wiktionary", titles)}
+    finally:
+        fetcher.close()
+
+
+def test_fetches_pages(wiki):
+    results = _fetch(["cat", "dog", "missing", "cat"])
+    assert {title: page.text for title, (page, error) in results.items() if page} == {"cat": page_text("cat"), "dog": page_text("dog")}
+    assert results["missing"] == (None, None)
+
+
+def test_titles_in_flight_are_fetched_once(wiki):
+    fetcher = Fetcher()
+    try:
+        first = fetcher.submit("en", "wiktionary", ["cat", "dog"])
+        second = fetcher.submit("en", "wiktionary", ["dog", "bird"])
+        assert second["dog"] is first["dog"]
+        assert [first[title].result().title for title in first] + [second["bird"].result().title] == ["cat", "dog", "bird"]
+    finally:
+        fetcher.close()
+    assert wiki.page_requests == {"cat": 1, "dog": 1, "bird": 1}
+
+
+def test_requests_per_host_are_limited(wiki, monkeypatch):
+    monkeypatch.setattr(config, "WIKI_QUERY_TITLES_LIMIT", 1)
+    titles = [f"word{i}" for i in range(16)]
+    fetcher = Fetcher()
+    try:
+        futures = [fetcher.submit(language, "wiktionary", titles) for language in ("en", "fi")]
+        for future in [future for by_title in futures for future in by_title.values()]:
+            future.result()
+    finally:
+        fetcher.close()
+
+    # two wikis with two requests each at a time
+    assert wiki.max_active == {"/en/wiktionary": 2, "/fi/wiktionary": 2}
+
+
+def test_token_bucket_limits_rate():
+    bucket = TokenBucket(rate=50, burst=5)
+    start = time.monotonic()
+    for _ in range(30):
+        bucket.acquire()
+    # the burst is taken right away, the rest at the rate
+    assert (30 - 5) / 50 <= time.monotonic() - start < (30 - 5) / 50 + 0.25
+
+
+def test_requests_per_second_are_limited(wiki, monkeypatch):
+    monkeypatch.setattr(config, "WIKI_QUERY_TITLES_LIMIT", 1)
+    monkeypatch.setattr(config, "FETCH_REQUESTS_PER_SECOND", 20)
+    _fetch([f"word{i}" for i in range(12)])
+    # after a burst of FETCH_MAX_CONNECTIONS_PER_HOST requests
+    assert wiki.request_times[-1] - wiki.request_times[0] >= (12 - 2) / 20 - 0.01
+
+
+def test_throughput(wiki, monkeypatch):
+    """Fetching 500 pages in requests of 50 takes about half as long as one request after another would, with two requests at a time.
+    """
+    monkeypatch.setattr(config, "WIKI_QUERY_TITLES_LIMIT", 50)
+    wiki.latency = 0.2
+    titles = [f"word{i}" for i in range(500)]
+
+    start = time.monotonic()
+    results = _fetch(titles)
+    elapsed = time.monotonic() - start
+    print(f"{len(titles)} pages in {elapsed:.2f}s, {len(titles) / elapsed:.0f} pages/s")
+
+    assert all(results[title][0].title == title for title in titles)
+    assert len(wiki.request_times) == 10
+    assert elapsed < 10 * wiki.latency * 0.75
+
+
+def test_failed_requests_fail_only_their_titles(wiki, monkeypatch):
+    monkeypatch.setattr(config, "WIKI_QUERY_TITLES_LIMIT", 2)
+    results = _fetch(["cat", "dog", "broken", "bird"])
+    assert results["cat"][0].title == "cat" and results["dog"][0].title == "dog"
+    # in the same request as "broken"
+    assert results["broken"][0] is None and results["broken"][1] is not None
+    assert results["bird"][0] is None and results["bird"][1] is not None
+
+
+def test_bulk_command_saves_pages_got_before_a_failure(database, wiki, monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(config, "WIKI_QUERY_TITLES_LIMIT", 1)
+    words_file = tmp_path / "words.txt"
+    words_file.write_text("cat\nbroken\ndog\nmissing\n")
+
+    commands.fetch_wiki_pages(str(words_file), "en", "wiktionary")
+
+    output = capsys.readouterr().out
+    assert "Couldn't get the page for 'broken' from wiktionary" in output
+    assert "Cannot find an entry for 'missing'" in output
+    assert "Saved 2 pages." in output
+    assert database.load_page("cat", "en", "wiktionary").text == page_text("cat")
+    assert database.load_page("dog", "en", "wiktionary").text == page_text("dog")
@@ -0,0 +1,117 @@
+import bz2
+import sqlite3
+import tracemalloc
+from xml.sax.saxutils import escape
+
+import pytest
+
+import tools.config as config
+from services import commands
+from services.importer import DumpStats, read_dump
+
+
+def _page_text(i: int, languages: tuple) -> str:
+    return "".join(f"=={language}==\n===Noun===\n# word{i} in {language}\n" for language in languages)
+
+
+def _dump_pages(count: int):
+    """Pages of a synthetic dump, as (title, namespace, page id, revision id, text, redirect) tuples.
+    Every 10th page is in the project namespace and every 7th a redirect. Every 3rd page has no English section.
+    """
+    for i in range(count):
+        namespace = 4 if i % 10 == 0 else 0
+        title = f"Wiktionary:Page{i}" if namespace else f"word{i}"
+        languages = ("Finnish", "Swedish") if i % 3 == 0 else ("English", "Finnish")
+        redirect = i % 7 == 0
+        text = "#REDIRECT [[word1]]" if redirect else _page_text(i, languages)
+        yield title, namespace, i + 1, 1000 + i, text, redirect
+
+
+def _write_dump(path, count: int) -> None:
+    open_dump = bz2.open if str(path).endswith(".bz2") else open
+    with open_dump(path, "wt", encoding="utf-8") as dump:
+        dump.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/" version="0.10" xml:lang="en">\n')
+        dump.write("<siteinfo><sitename>Wiktionary</sitename></siteinfo>\n")
+        for title, namespace, page_id, rev_id, text, redirect in _dump_pages(count):
+            dump.write(
+                f"<page><title>{escape(title)}</title><ns>{namespace}</ns><id>{page_id}</id>"
+                + ('<redirect title="word1" />' if redirect else "")
+                + f'<revision><id>{rev_id}</id><timestamp>2024-01-01T00:00:00Z</timestamp><text xml:space="preserve">{escape(text)}</text></revision>'
+                + "</page>\n"
+            )
+        dump.write("</mediawiki>\n")
+
+
+@pytest.fixture(params=["dump.xml", "dump.xml.bz2"])
+def dump_path(request, tmp_path):
+    path = tmp_path / request.param
+    _write_dump(path, 100)
+    return str(path)
+
+
+def test_reads_main_namespace_pages_without_redirects(dump_path):
+    stats = DumpStats()
+    pages = list(read_dump(dump_path, "en", "wiktionary", stats))
+
+    expected = [(title, page_id, rev_id, text) for title, namespace, page_id, rev_id, text, redirect in _dump_pages(100) if namespace == 0 and not redirect]
+    assert [(page.title, page.page_id, page.rev_id, page.text) for page in pages] == expected
+    assert stats.pages_read == 100
+    assert stats.pages_kept == len(expected)
+    assert stats.bytes_read > 0
+
+
+def test_reads_only_the_language_section(dump_path):
+    pages = list(read_dump(dump_path, "en", "wiktionary", DumpStats(), "english"))
+
+    expected = [(title, _page_text(page_id - 1, ("English",))) for title, namespace, page_id, rev_id, text, redirect in _dump_pages(100)
+                if namespace == 0 and not redirect and "==English==" in text]
+    assert [(page.title, page.text) for page in pages] == expected
+    assert pages[0].find_page_sections("@d")[0].title == "Noun"
+
+
+def test_import_command_saves_pages(database, dump_path, tmp_path, monkeypatch, capsys):
+    # several transactions
+    monkeypatch.setattr(config, "DB_IMPORT_BATCH_SIZE", 10)
+    commands.import_dump(dump_path, "en", "wiktionary", "Finnish")
+
+    kept = [title for title, namespace, page_id, rev_id, text, redirect in _dump_pages(100) if namespace == 0 and not redirect]
+    assert f"Saved {len(kept)} pages." in capsys.readouterr().out
+
+    page = database.load_page("word2", "en", "wiktionary")
+    assert page.text == _page_text(2, ("Finnish",))
+    assert (page.page_id, page.rev_id) == (3, 1002)
+    assert database.load_page("Wiktionary:Page10", "en", "wiktionary") is None
+
+    connection = sqlite3.connect(tmp_path / ".local/state/wiktionary-cli" / config.DB_FILE_NAME)
+    assert connection.execute("SELECT COUNT(*) FROM Pages").fetchone()[0] == len(kept)
+    # the index dropped for the import is made again
+    assert connection.execute("SELECT name FROM sqlite_master WHERE name = 'idx_page_key'").fetchone() is not None
+
+
+def test_memory_use_doesnt_grow_with_dump(tmp_path):
+    peaks = []
+    for count in (1000, 10000):
+        path = tmp_path / f"dump{count}.xml.bz2"
+        _write_dump(path, count)
+        tracemalloc.start()
+        for _ in read_dump(str(path), "en", "wiktionary", DumpStats()):
+            pass
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    # ten times the pages, with leeway for the allocator
+    assert peaks[1] < peaks[0] * 2
+
+
+def test_import_keeps_pages_over_the_cache_limits(database, dump_path, tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(config, "DB_IMPORT_BATCH_SIZE", 10)
+    monkeypatch.setattr(config, "DB_PAGE_ARCHIVE_LENGTH", 20)
+    commands.import_dump(dump_path, "en", "wiktionary", None)
+
+    kept = [title for title, namespace, page_id, rev_id, text, redirect in _dump_pages(100) if namespace == 0 and not redirect]
+    connection = sqlite3.connect(tmp_path / ".local/state/wiktionary-cli" / config.DB_FILE_NAME)
+    assert [name for name, in connection.execute("SELECT name FROM Pages ORDER BY id")] == kept
+    output = capsys.readouterr()
+    assert f"Saved {len(kept)} pages." in output.out
+    assert "DB_PAGE_ARCHIVE_LENGTH (20 pages)" in output.err
+    assert database.is_over_cache_limits()
@@ -0,0 +1,103 @@
+import io
+import sqlite3
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import pytest
+
+import tools.config as config
+from fake_wiki import FakeWiki
+from services import commands, transport
+from tools.wikiparser import WikiPage
+
+
+@pytest.fixture
+def wiki(monkeypatch):
+    server = FakeWiki().start()
+    monkeypatch.setattr(config, "WIKI_API_URL", server.api_url)
+    yield server
+    server.stop()
+    transport.close_session()
+
+
+@pytest.fixture
+def pages_table(database, tmp_path):
+    """The saved pages' name, hits and datetime, by name.
+    """
+    connection = sqlite3.connect(tmp_path / ".local/state/wiktionary-cli" / config.DB_FILE_NAME, isolation_level=None)
+
+    def read() -> dict[str, tuple[int, str]]:
+        return {name: (hits, date) for name, hits, date in connection.execute("SELECT name, hits, datetime FROM Pages")}
+
+    read.connection = connection
+    return read
+
+
+def _look_up(title: str) -> str:
+    output = io.StringIO()
+    with redirect_stdout(output):
+        commands.fetch_wiki_page(title, "en", "Noun", "wiktionary")
+        # the background refresh of an expired page
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and not thread.daemon:
+                thread.join()
+    return output.getvalue()
+
+
+def test_each_lookup_is_one_use(database, wiki, pages_table):
+    # saving the page counts as its first use
+    assert "cat definition" in _look_up("cat")
+    assert pages_table()["cat"][0] == 1
+    for hits in range(2, 5):
+        assert "cat definition" in _look_up("cat")
+        assert pages_table()["cat"][0] == hits
+    assert wiki.page_requests == {"cat": 1}
+
+
+def test_expired_page_is_used_once(database, wiki, pages_table, monkeypatch):
+    _look_up("cat")
+    pages_table.connection.execute("UPDATE Pages SET datetime = DATETIME('now', 'localtime', '-1 year')")
+    monkeypatch.setattr(config, "DB_SERVE_EXPIRED_PAGES", True)
+
+    # shown right away, then found unchanged on the wiki in the background
+    assert "cat definition" in _look_up("cat")
+    hits, date = pages_table()["cat"]
+    assert hits == 2
+    assert not database.page_needs_update(datetime.fromisoformat(date))
+
+
+def test_checking_saved_pages_doesnt_use_them(database, wiki, pages_table):
+    _look_up("cat")
+    database.load_page("cat", "en", "wiktionary")
+    database.load_page("cat", "en", "wiktionary", include_expired=True)
+    database.load_page_language("cat", "en", "wiktionary", "English")
+    assert pages_table()["cat"][0] == 1
+
+
+def test_uncompressed_pages_are_compressed_after_writes(database, pages_table, monkeypatch):
+    monkeypatch.setattr(config, "DB_COMPRESSIONS_PER_WRITE", 2)
+    texts = {f"word{i}": f"==English==\n===Noun===\n# word{i}\n" + "text " * 1000 for i in range(5)}
+    database.save_pages([WikiPage(text, title, "en", "wiktionary") for title, text in texts.items()])
+    connection = pages_table.connection
+    # as saved before pages were compressed
+    for title, text in texts.items():
+        connection.execute("UPDATE Pages SET content = ?, compression = NULL WHERE name = ?", [text, title])
+
+    def uncompressed() -> int:
+        return connection.execute("SELECT COUNT(*) FROM Pages WHERE compression IS NULL").fetchone()[0]
+
+    # reading doesn't write
+    for title in texts:
+        assert database.load_page(title, "en", "wiktionary").text == texts[title]
+        assert database.load_page_language(title, "en", "wiktionary", "English").text == texts[title]
+    assert uncompressed() == 5
+
+    plan = connection.execute("EXPLAIN QUERY PLAN SELECT id, content, site, language FROM Pages WHERE compression IS NULL LIMIT 2").fetchall()
+    assert "idx_uncompressed_pages" in str(plan)
+
+    for remaining in (3, 1, 0):
+        database.save_page(WikiPage("==English==\n", f"new{remaining}", "en", "wiktionary"))
+        assert uncompressed() == remaining
+    for title in texts:
+        assert database.load_page(title, "en", "wiktionary").text == texts[title]
@@ -0,0 +1,70 @@
+import random
+import tracemalloc
+
+import pytest
+
+import legacy_sections
+from tools.wikiparser import WikiPage
+
+LANGUAGES = ["English", "Finnish", "Swedish", "French", "German", "Spanish", "Italian", "Dutch"]
+
+
+def _page_text(seed: int) -> str:
+    """A large wiktionary page, about 100 KB, of many languages with long sections.
+    """
+    rng = random.Random(seed)
+    lines = []
+    for language in LANGUAGES:
+        lines.append(f"=={language}==")
+        for etymology in range(1, rng.randint(2, 4)):
+            lines.append(f"===Etymology {etymology}===\nFrom {{{{inh|en|enm|x}}}}.")
+            for word_class in rng.sample(["Noun", "Verb", "Adjective", "Adverb"], 2):
+                lines.append(f"===={word_class}====")
+                lines += [f"# {{{{lb|en|sense}}}} Definition {i} of [[word]] with '''text''' {rng.random()}.\n#: {{{{ux|en|An example.}}}}" for i in range(rng.randint(10, 30))]
+                lines.append("=====Translations=====\n{{trans-top|x}}\n" + "\n".join(f"* {language}: {{{{t|xx|word{i}}}}}" for i in range(40)))
+    return "\n".join(lines)
+
+
+def _memory(parse: callable, texts: list[str]) -> tuple[int, int]:
+    """The peak memory while parsing texts, and the memory the parsed pages keep, in bytes. The texts themselves aren't counted.
+    """
+    tracemalloc.start()
+    try:
+        pages = [parse(text) for text in texts]
+        kept, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert len(pages) == len(texts)
+    return peak, kept
+
+
+def _parse(text: str) -> WikiPage:
+    page = WikiPage(text, "x", "en", "wiktionary")
+    page.find_page_sections("@d")
+    return page
+
+
+@pytest.fixture(scope="module")
+def corpus() -> list[str]:
+    return [_page_text(seed) for seed in range(40)]
+
+
+def test_sections_keep_spans_instead_of_contents(corpus):
+    """Sections slice their contents from the page's text when used (see Section.content), instead of each keeping a copy,
+    which is what the old parser did (see legacy_sections).
+    """
+    text_size = sum(len(text) for text in corpus)
+    peak, kept = _memory(_parse, corpus)
+    legacy_peak, legacy_kept = _memory(lambda text: legacy_sections.split_into_sections(text, "x"), corpus)
+    print(f"{text_size / 1e6:.1f} MB of text. Peak: {peak / 1e6:.1f} MB, old {legacy_peak / 1e6:.1f} MB. "
+          f"Kept: {kept / 1e6:.1f} MB, old {legacy_kept / 1e6:.1f} MB")
+
+    # the old sections' copies are about as large as the text
+    assert legacy_kept > text_size
+    assert kept < legacy_kept / 2
+    assert peak < legacy_peak
+
+
+def test_contents_are_the_same(corpus):
+    for text in corpus[:5]:
+        assert legacy_sections.as_tuples(WikiPage(text, "x", "en", "wiktionary").root_section) == legacy_sections.split_into_sections(text, "x")
@@ -0,0 +1,100 @@
+import pytest
+
+from tools.wikiparser import WikiPage, compile_section_path
+
+PAGE_TEXT = """{{also|Set}}
+==English==
+===Etymology 1===
+From Old English.
+====Noun====
+# A collection.
+====Verb====
+# To put.
+=====Translations=====
+* Finnish: {{t|fi|asettaa}}
+===Etymology 2===
+====Noun====
+# A badger's burrow.
+=====Synonyms=====
+* sett
+==Finnish==
+===Noun===
+# A set.
+"""
+
+QUERIES = ["English.**", "**", "English.**.Noun", "*.*", "**.**.Noun", "*.Etymology 1.*", "english.etymology 2.noun", "@d", "@t", "Noun"]
+
+
+def _tree(section) -> list:
+    """The sections under section, and their children lists, as (title, section, children list, children) tuples.
+    """
+    return [(child.title, child, child.children, _tree(child)) for child in section.children]
+
+
+def _walk(section) -> list:
+    """section and the sections under it, in the order they are on the page.
+    """
+    sections = [section]
+    for child in section.children:
+        sections += _walk(child)
+    return sections
+
+
+@pytest.fixture(params=[False, True], ids=["parsed", "lazy"])
+def page(request):
+    return WikiPage(PAGE_TEXT, "set", "en", "wiktionary", lazy=request.param)
+
+
+def test_queries_dont_change_the_tree(page):
+    root = page.root_section
+    # a lazy page's sections are parsed as they are reached
+    page.find_page_sections("**")
+    tree, string, count = _tree(root), str(root), root.count_children()
+
+    for _ in range(5):
+        for query in QUERIES:
+            page.find_page_sections(query)
+
+    assert _tree(root) == tree
+    assert str(root) == string
+    assert root.count_children() == count == 10
+
+
+# "@d" is ordered by word class (see test_repeated_definition_lookups)
+@pytest.mark.parametrize("query", [query for query in QUERIES if query != "@d"])
+def test_results_are_in_page_order_without_duplicates(page, query):
+    positions = {id(section): i for i, section in enumerate(_walk(page.root_section))}
+    results = page.find_page_sections(query)
+    if query == "@t":
+        results = [view.section for view in results]
+
+    order = [positions[id(section)] for section in results]
+    assert order == sorted(set(order))
+
+
+def test_path_results(page):
+    def titles(query):
+        return [(section.parent.title, section.title) for section in page.find_page_sections(query)]
+
+    assert titles("English.**.Noun") == [("Etymology 1", "Noun"), ("Etymology 2", "Noun")]
+    assert titles("**.Noun") == [("Etymology 1", "Noun"), ("Etymology 2", "Noun"), ("Finnish", "Noun")]
+    assert titles("*.Noun") == [("Finnish", "Noun")]
+    assert titles("English.Etymology 2.*") == [("Etymology 2", "Noun")]
+    assert titles("English.**.*.Synonyms") == [("Noun", "Synonyms")]
+    # "**" matches no sections too, i.e. the root
+    assert page.find_page_sections("**") == _walk(page.root_section)
+    # not a path from the page's root, so found by title
+    assert titles("Translations") == [("Verb", "Translations")]
+
+
+def test_repeated_definition_lookups(page):
+    first = page.find_page_sections("@d")
+    assert [(section.parent.title, section.title) for section in first] == \
+        [("Etymology 1", "Noun"), ("Etymology 2", "Noun"), ("Etymology 1", "Verb")]
+    for _ in range(10):
+        assert page.find_page_sections("@d") == first
+
+
+def test_compiled_paths_are_reused():
+    assert compile_section_path("English.**.Noun") is compile_section_path("English.**.Noun")
+    assert compile_section_path("English.**.Noun").steps == compile_section_path(".english.**.noun").steps
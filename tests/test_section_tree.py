@@ -0,0 +1,78 @@
+import gc
+import random
+import time
+
+import pytest
+
+import legacy_sections
+from tools.wikiparser import WikiPage
+
+TITLES = ["English", "Etymology 1", "Noun", "Verb", "Translations", "Synonyms", "Usage notes", "References"]
+
+
+def _page_text(seed: int, headings: int) -> str:
+    """A page of randomly nested headings, none of them skipping a level, under which the old builder made the same tree.
+    """
+    rng = random.Random(seed)
+    lines = ["{{also|x}}"]
+    depth = 1
+    for i in range(headings):
+        depth = rng.randint(2, depth + 1)
+        title = rng.choice(TITLES)
+        lines.append("=" * depth + f"{title} {i}" + "=" * depth)
+        lines += [f"# line {j} of {i} " for j in range(rng.randint(0, 3))] + [""] * rng.randint(0, 2)
+    return "\n".join(lines)
+
+
+@pytest.mark.parametrize("lazy", [False, True], ids=["parsed", "lazy"])
+@pytest.mark.parametrize("seed", range(50))
+def test_same_tree_as_legacy_builder(seed, lazy):
+    text = _page_text(seed, random.Random(seed).randint(1, 60))
+    page = WikiPage(text, "x", "en", "wiktionary", lazy=lazy)
+    assert legacy_sections.as_tuples(page.root_section) == legacy_sections.split_into_sections(text, "x")
+
+
+def test_numbers_are_positions_among_siblings():
+    page = WikiPage(_page_text(0, 500), "x", "en", "wiktionary")
+    unvisited = [page.root_section]
+    while unvisited:
+        section = unvisited.pop()
+        assert [child.number for child in section.children] == list(range(1, len(section.children) + 1))
+        unvisited += section.children
+
+
+def test_numbers_are_stable():
+    text = _page_text(1, 500)
+    first = legacy_sections.as_tuples(WikiPage(text, "x", "en", "wiktionary").root_section)
+    page = WikiPage(text, "x", "en", "wiktionary", lazy=True)
+    for query in ["**", "@d", "*.*", "**"]:
+        page.find_page_sections(query)
+    assert legacy_sections.as_tuples(page.root_section) == first
+
+
+def _build_time(text: str) -> float:
+    """Fastest of a few runs, as the others are mostly noise.
+    The garbage collector is off, as its full collections take longer the more objects there are, whatever makes them.
+    """
+    times = []
+    gc.disable()
+    try:
+        for _ in range(3):
+            start = time.perf_counter()
+            WikiPage(text, "x", "en", "wiktionary")
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times)
+
+
+def test_scales_linearly():
+    """Building the tree of 32000 headings takes about 8 times as long as of 4000.
+    """
+    times = {}
+    for headings in [1000, 4000, 16000, 32000]:
+        times[headings] = _build_time(_page_text(headings, headings))
+        print(f"{headings:6d} headings: {times[headings] * 1000:8.2f} ms")
+
+    # 8 times the headings, with leeway for timing noise. The old builder took about 15 times as long.
+    assert times[32000] < times[4000] * 8 * 1.5
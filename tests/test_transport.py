@@ -0,0 +1,124 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import tools.config as config
+from services import transport
+
+
+class ScriptedServer(ThreadingHTTPServer):
+    """An HTTP server answering requests with the (status, headers) responses given, in order, and the last one after them.
+    """
+    daemon_threads = True
+
+    def __init__(self, responses: list[tuple[int, dict]]):
+        super().__init__(("127.0.0.1", 0), _ScriptedHandler)
+        self.responses = responses
+        self.requests = 0
+
+    @property
+    def url(self) -> str:
+        return "http://127.0.0.1:%d/api.php" % self.server_address[1]
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        status, headers = self.server.responses[min(self.server.requests, len(self.server.responses) - 1)]
+        self.server.requests += 1
+        data = b"{}"
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """The waits between tries, which are recorded instead of waited.
+    """
+    waits = []
+    monkeypatch.setattr(transport.time, "sleep", waits.append)
+    monkeypatch.setattr(config, "HTTP_RETRIES", 3)
+    yield waits
+    transport.close_session()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(responses: list[tuple[int, dict]]) -> ScriptedServer:
+        server = ScriptedServer(responses)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504, 429])
+def test_retries_error_statuses(serve, sleeps, status):
+    server = serve([(status, {}), (200, {})])
+    assert transport.get(server.url, {"action": "query"}).status_code == 200
+    assert server.requests == 2
+    assert len(sleeps) == 1 and 0 <= sleeps[0] <= config.HTTP_BACKOFF
+
+
+def test_doesnt_retry_other_errors(serve, sleeps):
+    server = serve([(404, {}), (200, {})])
+    assert transport.get(server.url, {}).status_code == 404
+    assert server.requests == 1 and sleeps == []
+
+
+def test_honors_retry_after_seconds(serve, sleeps):
+    # longer than the client's own backoff is allowed to be
+    server = serve([(429, {"Retry-After": "45"}), (200, {})])
+    assert transport.get(server.url, {}).status_code == 200
+    assert sleeps == [45.0]
+
+
+def test_honors_retry_after_date(serve, sleeps):
+    retry_at = datetime.now(timezone.utc) + timedelta(seconds=40)
+    server = serve([(503, {"Retry-After": format_datetime(retry_at, usegmt=True)}), (200, {})])
+    assert transport.get(server.url, {}).status_code == 200
+    # the date has whole seconds
+    assert len(sleeps) == 1 and 38 <= sleeps[0] <= 40
+
+
+def test_doesnt_wait_longer_than_allowed(serve, sleeps):
+    server = serve([(429, {"Retry-After": str(config.HTTP_MAX_RETRY_AFTER + 1)}), (200, {})])
+    assert transport.get(server.url, {}).status_code == 429
+    assert server.requests == 1 and sleeps == []
+
+
+def test_gives_up_on_the_last_try(serve, sleeps):
+    server = serve([(503, {})])
+    assert transport.get(server.url, {}).status_code == 503
+    assert server.requests == config.HTTP_RETRIES + 1
+    assert len(sleeps) == config.HTTP_RETRIES
+    # growing backoff, with jitter
+    assert all(0 <= wait <= config.HTTP_BACKOFF * 2 ** attempt for attempt, wait in enumerate(sleeps))
+
+
+def test_raises_if_the_last_try_cant_connect(serve, sleeps):
+    server = serve([(200, {})])
+    url = server.url
+    server.shutdown()
+    server.server_close()
+    with pytest.raises(requests.ConnectionError):
+        transport.get(url, {})
+    assert len(sleeps) == config.HTTP_RETRIES
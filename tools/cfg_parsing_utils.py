@@ -23,4 +23,23 @@ def expiration_time_to_seconds(time_str: str) -> int:
                         match_str = time_str[m.start() :  m.end()].strip(abbrev)
                         seconds_sum += int(match_str) * multiplier
 
-        return seconds_sum
\ No newline at end of file
+        return seconds_sum
+
+def size_to_bytes(size_str: str) -> int:
+        """Convert a size like "1GB", "500 MB" or "2048" (bytes) to bytes.
+        """
+        # abbreviation and multiplier for converting to bytes
+        abbrevs = {
+                "kb" : 1000,
+                "mb" : 1000 ** 2,
+                "gb" : 1000 ** 3,
+                "tb" : 1000 ** 4,
+                "b"  : 1,
+                ""   : 1,
+        }
+
+        m = re.fullmatch("([0-9.]+) *([a-z]*)", size_str.strip().lower())
+        if m == None or m.group(2) not in abbrevs:
+                raise ValueError(f"Invalid size: \"{size_str}\"")
+
+        return int(float(m.group(1)) * abbrevs[m.group(2)])
\ No newline at end of file
@@ -3,11 +3,34 @@ DB_DIRECTORY_PATH = "$HOME/.local/state/wiktionary-cli/"
 DB_FILE_NAME = "data.db"
 
 DB_SAVE_SEARCHES = True
+DB_SEARCH_ARCHIVE_LENGTH = 100 # searches kept at most, oldest ones are removed first
+DB_SAVE_FAILED_SEARCHES = True # remember pages that weren't found, so that they aren't searched from the wiki every time
+DB_FAILED_SEARCH_EXPIRATION_TIME = "1d"
+DB_SAVE_SEARCH_RESULTS = True # reuse the results of searches (-s) done recently instead of searching the wiki again
+DB_SEARCH_RESULTS_EXPIRATION_TIME = "1d"
+DB_SEARCH_RESULTS_CACHE_SIZE = 1000 # searches whose results are kept, least recently used ones are removed first
 
 DB_SAVE_PAGES = True
 DB_USE_SAVED_PAGES = True
 DB_PAGE_EXPIRATION_TIME = "10d"
+DB_SERVE_EXPIRED_PAGES = True # print an expired saved page right away, and update it in the background for the next time
+DB_IMPORT_BATCH_SIZE = 5000 # pages per transaction when importing a dump
+DB_PAGE_ARCHIVE_LENGTH = 100000 # saved pages kept at most
+MAX_DB_SIZE = "1GB" # saved pages and sections are removed when their contents take more space
+DB_EVICTION_POLICY = "lru" # which saved pages are removed first: "lru" (least recently used), "lfu" (least often used) or "hybrid" (least often used per day)
+DB_EVICTIONS_PER_WRITE = 4 # pages removed at most per page saved, so that removing isn't done all at once
+DB_VACUUM_PAGES_PER_WRITE = 256 # database pages (4KB each by default) of freed space given back to the file system per write
 #DB_PAGE_EXPIRATION_TIME = "10y 20m 30w 40d 50h 60min 70s"
+DB_BUSY_TIMEOUT = 10 # seconds to wait for other processes' writes to the database
+DB_BUSY_RETRIES = 5 # times to try again if the database is still locked after that
+DB_FETCH_LOCK_TIMEOUT = 30 # seconds to wait for another process getting the same page from the wiki, before getting it anyway
+DB_COMPRESS_PAGES = True # save pages' contents compressed with zlib
+DB_COMPRESSIONS_PER_WRITE = 16 # pages saved before pages were compressed that are compressed per write
+DB_COMPRESSION_LEVEL = 6 # 1 (fastest) to 9 (smallest)
+DB_COMPRESSION_DICTS = True # compress pages with a dictionary made from a site's and language's saved pages, which helps most with small pages
+DB_COMPRESSION_DICT_SAMPLES = 500 # saved pages a dictionary is made from
+DB_CACHE_SIZE = 8192 # KiB of the database kept in memory per connection
+DB_MMAP_SIZE = 64 * 1024 * 1024 # bytes of the database file read through memory mapping
 
 # formatting
 INDENTATION_STR = "|   "
@@ -15,11 +38,27 @@ INDENTATION_STR = "|   "
 # cli
 PATH_SEP = "."
 
+# importing dumps
+DUMP_IMPORT_NAMESPACES = [0] # main namespace only
+
 # querying wiki
 WIKI_SEARCH_RESULTS_LIMIT = 20
+WIKI_API_URL = "https://{language}.{site}.org/w/api.php"
+WIKI_QUERY_TITLES_LIMIT = 50 # pages per request when getting many pages
+WIKI_FETCH_SECTIONS_ONLY = True # get only the sections a path points to from wikipedia, instead of whole articles
+WIKI_PREFETCH_LINKS = False # always do what -p/--prefetch does
+WIKI_PREFETCH_PAGES = 20 # most linked pages prefetched after printing a page
+
+# http
+HTTP_TIMEOUT = 10 # seconds, for connecting and for waiting for data
+HTTP_RETRIES = 3
+HTTP_BACKOFF = 0.5 # seconds, doubled after each retry
+HTTP_MAX_BACKOFF = 30 # seconds
+HTTP_MAX_RETRY_AFTER = 60 # seconds. If a server asks to wait longer before retrying, the request fails instead
+HTTP_POOL_SIZE = 10 # connections kept alive per host
+HTTP_USER_AGENT = "wiktionary-cli (command line Wiktionary/Wikipedia reader)"
 
-# not yet implemented:
-DB_SAVE_FAILED_SEARCHES = False
-DB_PAGE_ARCHIVE_LENGTH = 100
-DB_SEARCH_ARCHIVE_LENGTH = 100
-MAX_DB_SIZE = "1GB"
+# getting many pages at once
+FETCH_MAX_WORKERS = 8
+FETCH_MAX_CONNECTIONS_PER_HOST = 2 # requests to one wiki at a time
+FETCH_REQUESTS_PER_SECOND = 5 # per wiki
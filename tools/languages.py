@@ -10,6 +10,9 @@ definitions = {
         ],
 }
 
+# lowercased definitions, for matching section titles
+definition_titles = { lang : frozenset(d.lower() for d in defs) for lang, defs in definitions.items() }
+
 translations = {
         "en" : "Translations",
         "fi" : "Käännökset",
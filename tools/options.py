@@ -11,8 +11,12 @@ VALID_OPTIONS = {
         ("-f", "--force-web") : "Fetch page from wiki even if a local copy exists.",
         ("-ls", "--list-searches") : "Print saved searches and exit.",
         ("-lp", "--list-pages") : "Print saved pages and exit.",
+        ("-cs", "--cache-stats") : "Print the local database's cache hit and miss counts and exit.",
         ("-c", "--compact") : "Output pages in a more compact format.",
         ("-v", "--verbose") : "Verbose output.",
+        ("-p", "--prefetch") : "After printing, get and save the pages that the printed sections link to in the background.",
+        ("-b", "--bulk") : "Get and save the pages for all words in a file (one per line, - for stdin) given in place of a title.",
+        ("-i", "--import") : "Import pages from a wiki's xml dump file given in place of a title. Only pages with the language section given in place of a path are imported, if given.",
 }
 
 VALID_OPTIONS_LIST = reduce(lambda o,l: o+l, VALID_OPTIONS.keys())
@@ -27,29 +31,40 @@ def init() -> None:
         global UNKNOWN_OPTIONS
 
         POSITIONAL_ARGS = [a for a in argv[1:] if a not in VALID_OPTIONS_LIST]
-        OPTIONS = [a for a in argv[1:] if a.startswith("-")]
+        OPTIONS = [a for a in argv[1:] if a.startswith("-") and a != "-"] # lone "-" means stdin
         UNKNOWN_OPTIONS  = [opt for opt in OPTIONS if opt not in VALID_OPTIONS_LIST]
 
         global DO_FORMATTING
         global DO_SEARCH
         global LIST_SEARCHES
         global LIST_PAGES
+        global CACHE_STATS
         global FORCE_WEB
         global PRINT_HELP
         global VERBOSE
         global COMPACT
+        global BULK
+        global IMPORT
+        global PREFETCH
 
         DO_FORMATTING = False if "-r" in OPTIONS or "--raw" in OPTIONS else True
         DO_SEARCH = True if "-s" in OPTIONS or "--search" in OPTIONS else False
         FORCE_WEB = True if "-f" in OPTIONS or "--force-web" in OPTIONS else False
         LIST_SEARCHES = True if "-ls" in OPTIONS or "--list-searches" in OPTIONS else False
         LIST_PAGES = True if "-lp" in OPTIONS or "--list-pages" in OPTIONS else False
+        CACHE_STATS = True if "-cs" in OPTIONS or "--cache-stats" in OPTIONS else False
         PRINT_HELP = True if "-h" in OPTIONS or "--help" in OPTIONS else False
         VERBOSE = True if "-v" in OPTIONS or "--verbose" in OPTIONS else False
         COMPACT = True if "-c" in OPTIONS or "--compact" in OPTIONS else False
+        BULK = True if "-b" in OPTIONS or "--bulk" in OPTIONS else False
+        IMPORT = True if "-i" in OPTIONS or "--import" in OPTIONS else False
+        PREFETCH = True if "-p" in OPTIONS or "--prefetch" in OPTIONS else False
 
         if UNKNOWN_OPTIONS:
                 raise Exception(f'Unkown options: {", ".join(UNKNOWN_OPTIONS)}')
+        elif PRINT_HELP or LIST_SEARCHES or LIST_PAGES or CACHE_STATS:
+                # these don't need the other arguments
+                return
         elif len(POSITIONAL_ARGS) < 3:
                 raise Exception('Not enough arguments.')
         elif len(POSITIONAL_ARGS) > 4:
@@ -1,10 +1,11 @@
 import re
 from tools.wikiparser import Section
-from time import sleep
+import tools.wikitree as wikitree
 from time import time
 from tools import options
 from tools.logger import log
 from collections import namedtuple
+from functools import lru_cache
 
 Bracket = namedtuple('Bracket', ['pos', 'str'])
 """Position is the position of the starting/ending_bracket's first character's position in 'text'.
@@ -12,120 +13,68 @@ Bracket = namedtuple('Bracket', ['pos', 'str'])
 
 # some utility functions
 
+@lru_cache(maxsize=None)
+def _bracket_regex(starting_bracket: str, ending_bracket: str) -> re.Pattern:
+        """Compiled pattern matching, at every position of a string, either of the brackets.
+
+        The match is a zero-width lookahead so that overlapping brackets (e.g. "{{{") are all found,
+        and the starting bracket takes precedence over the ending bracket at the same position.
+        """
+        return re.compile("(?=(" + re.escape(starting_bracket) + ")|(" + re.escape(ending_bracket) + "))")
+
 def _find_brackets(text: str, starting_bracket: str, ending_bracket: str) -> list[Bracket]:
         """
         Find brackets and their positions in a string.
         Returns brackets in the same order as they are found in the string.
         Returns a list of Brackets.
         """
-
-        s_bracket_len = len(starting_bracket)
-        e_bracket_len = len(ending_bracket)
-
         brackets = []
-        for char_i in range(len(text)):
-                if text[char_i : char_i + s_bracket_len] == starting_bracket:
-                        brackets.append(Bracket(char_i, starting_bracket))
-                elif text[char_i : char_i + e_bracket_len] == ending_bracket:
-                        brackets.append(Bracket(char_i, ending_bracket))
+        for m in _bracket_regex(starting_bracket, ending_bracket).finditer(text):
+                if m.group(1) is not None:
+                        brackets.append(Bracket(m.start(), starting_bracket))
+                else:
+                        brackets.append(Bracket(m.start(), ending_bracket))
         return brackets
 
-def _is_overlapping(b1:Bracket, b2:Bracket) -> bool:
-        """check if brackets, of more than 1 character, overlap.
-        b1 and b2 are Brackets whose overlapping is to be tested.
-        """
-        result = False
-
-        b1_left_pos = b1.pos # position of left most char
-        b1_right_pos = b1.pos + len(b1.str) - 1 # position of right most char
-
-        b2_left_pos = b2.pos # --||–-
-        b2_right_pos = b2.pos + len(b2.str) - 1 # --||--
-
-        if b2_left_pos <= b1_right_pos <= b2_right_pos:
-                result = True
-
-        if b1_left_pos <= b2_right_pos <= b1_right_pos:
-                result = True
-
-        return result
-
-
-def _get_matching_brackets(brackets: list[Bracket], opening_bracket_str: str, closing_bracket_str: str, _used:dict=None, _pairs:list=None, _pointer:int=0, _has_no_pair:list=None, _iter_counter:int=0) -> tuple[list[Bracket], Bracket]:
+def _get_matching_brackets(brackets: list[Bracket], opening_bracket_str: str, closing_bracket_str: str) -> list[Bracket]:
         """Returns a list of Brackets, where every opening bracket is followed by it's closing bracket.
 
-        finds the pairs from the output of _find_brackets().
+        finds the pairs from the output of _find_brackets(), in a single pass using a stack of unclosed opening brackets.
+        Pairs are returned in the order in which they are closed, i.e. nested pairs before the pairs enclosing them.
 
-        Recursive function for matching closing and ending brackets from a list of brackets (including nested ones)
+        Brackets overlapping a matched pair (e.g. the extra "{" in "{{{") can't be used again.
+        A closing bracket without an opening bracket stops the matching.
         """
-        """Re-implemented _get_matching_bracket_positions.
-        Only continues checking the brackets forward if there is a starting bracket for every closing bracket found. Otherwise stops going forwards."""
         start_time = time()
 
-        # init stuff at first loop, at recursion depth 0.
-        if _pairs == None:
-                _pairs = []
-        if _used == None:
-                _used = {b:False for b in brackets}
-        # _has_no_pair used for optimizing strings which include opening brackets that are not closed
-        if _has_no_pair == None:
-                _has_no_pair = {b:False for b in brackets}
-
-        ending_pair = None
-        starting_pair = brackets[_pointer] if _pointer < len(brackets) else None
-        for cur_pointer in range(_pointer, len(brackets)):
-                bracket = brackets[cur_pointer]
-
-                # printing, for debugging
-                if options.VERBOSE == True:
-                        print('\x1b[1F',end="")
-                        for b in brackets:
-                                if b in _pairs:
-                                        print(f"\x1b[38;5;154;1m",end="")
-                                elif _used[b] == True:
-                                        print(f"\x1b[38;5;63m", end="")
-                                elif _has_no_pair[b] == True:
-                                        print(f"\x1b[38;5;124;4m", end="")
-                                else:
-                                        #print(f"\x1b[38;5;255m", end="")
-                                        ...
-                                print(b[1]+"\x1b[0m",end="")
-                        print()
-
-                        print("\x1b[0G"+80*" ", end="")
-                        print(f"\x1b[{bracket.pos}G", end ="")
-                        if _used[bracket]: print("\x1b[38;5;112m", end="")
-                        if _has_no_pair[bracket]: print("\x1b[48;5;196m", end="")
-                        print("^",end="")
-                        print("\x1b[0m",end="")
-                        print("\x1b[80G",end="", flush=True)
-                        sleep(0.01)
-
-                if _used[bracket] or _has_no_pair[bracket]:
+        opening_len = len(opening_bracket_str)
+        closing_len = len(closing_bracket_str)
+
+        pairs = []
+        unclosed = []
+        used_until = 0 # brackets starting before this overlap the last closing bracket
+        for bracket in brackets:
+                if bracket.pos < used_until:
                         continue
 
-                if bracket.str == closing_bracket_str:
-                        ending_pair = bracket
+                if bracket.str == opening_bracket_str:
+                        unclosed.append(bracket)
+                        continue
+
+                if not unclosed:
                         break
 
-                if bracket.str == opening_bracket_str:
-                        starting = bracket
-                        _, ending = _get_matching_brackets(brackets, opening_bracket_str, closing_bracket_str, _used, _pairs, cur_pointer+1, _has_no_pair, _iter_counter)
+                starting = unclosed.pop()
+                pairs.append(starting)
+                pairs.append(bracket)
+                used_until = bracket.pos + closing_len
 
-                        if ending != None and _used[starting] != True and _used[ending] != True:
-                                _pairs.append(starting)
-                                _pairs.append(ending)
-                                _used[starting] = True
-                                _used[ending] = True
-                                # overlapping ones can neither be used again
-                                for b in brackets:
-                                        if _is_overlapping(ending, b): _used[b] = True
-                                        if _is_overlapping(starting, b): _used[b] = True
+                # unclosed brackets overlapping the starting bracket can neither be used again
+                while unclosed and unclosed[-1].pos + opening_len > starting.pos:
+                        unclosed.pop()
 
-        if not ending_pair and starting_pair:
-                _has_no_pair[starting_pair] = True
-        if _pointer == 0: log("bracket matching took:", round(time() - start_time, 5), "seconds")
-        return _pairs, ending_pair
+        log("bracket matching took:", round(time() - start_time, 5), "seconds")
+        return pairs
 
 
 def find_bracketed_strings(text: str, starting_bracket: str, ending_bracket: str) -> tuple:
@@ -153,7 +102,7 @@ def find_bracketed_strings(text: str, starting_bracket: str, ending_bracket: str
         else:
                 log(text)
                 brackets = _find_brackets(text, starting_bracket, ending_bracket)
-                matching_brackets,_ = _get_matching_brackets(brackets, starting_bracket, ending_bracket)
+                matching_brackets = _get_matching_brackets(brackets, starting_bracket, ending_bracket)
                 for i in range(0,len(matching_brackets),2):
                         left_pos = matching_brackets[i].pos
                         right_pos = matching_brackets[i+1].pos + len(matching_brackets[i+1].str)
@@ -166,24 +115,6 @@ def find_bracketed_strings(text: str, starting_bracket: str, ending_bracket: str
         return bracketed_strs
 
 
-def _join_multiline_brackets(text:str) -> str:
-        """Returns a copy of 'text' where brackets that span over multiple lines are joined onto the same line.
-        Joins lines beginning with "|" together with their preceding lines.
-        """
-        joined_lines = []
-        lines = text.splitlines()
-        for line_i in range(len(lines)):
-                line = lines[line_i]
-                if line.startswith("|"):
-                        prev_line = joined_lines.pop()
-                        joined_line = prev_line + line
-                        joined_lines.append(joined_line)
-                else:
-                        joined_lines.append(line)
-
-        return '\n'.join(joined_lines)
-
-
 def format_indents(text: str) -> str:
         """Returns a copy of the text with indentation and line numbers added.
         """
@@ -318,7 +249,7 @@ def format_all_brackets(text: str, starting_bracket:str, ending_bracket:str, for
         """
         start_time = time()
 
-        mod_text = ""
+        mod_text = []
         brackets = find_bracketed_strings(text, starting_bracket, ending_bracket)
         left_at = 0
         for b in brackets:
@@ -330,41 +261,268 @@ def format_all_brackets(text: str, starting_bracket:str, ending_bracket:str, for
                 bracketed_str = target_bracket[0]
 
                 replacement = format_func(bracketed_str)
-                mod_text += text[ left_at : bracket_start] + replacement
+                mod_text.append(text[ left_at : bracket_start])
+                mod_text.append(replacement)
                 left_at = bracket_end
-        mod_text += text[ left_at : ]
+        mod_text.append(text[ left_at : ])
 
         end_time = time()
         log("formatting took:", end_time - start_time, "seconds")
 
-        return mod_text
+        return "".join(mod_text)
+
+
+def _format_bold(s: str) -> str:
+        return "\x1b[1m" + s.strip("'") + "\x1b[22m"
+
+def _format_italic(s: str) -> str:
+        return "\x1b[3m" + s.strip("'") + "\x1b[23m"
+
+def _format_link(s: str) -> str:
+        return "\x1b[35m" + s.strip("[]").replace(" ", "·") + "\x1b[39m"
+
+def _format_inline_by_passes(text: str) -> str:
+        """Formats bold, italic, refs, code, links and templates in 'text', one kind of bracket at a time.
+
+        Every pass is done on the output of the previous one.
+        """
+        text = format_all_brackets(text, "'''", "'''", _format_bold)
+        text = format_all_brackets(text, "<ref", "</ref>", lambda s: "" )
+        text = format_all_brackets(text, "<ref", "/>", lambda s: "" )
+        text = format_all_brackets(text, "<code", "</code>", lambda s: "" )
+        text = format_all_brackets(text, "<code", "/>", lambda s: "" )
+        text = format_all_brackets(text, "''", "''", _format_italic)
+        text = format_all_brackets(text, "[[", "]]", _format_link)
+        text = format_all_brackets(text, "{{", "}}", format_curly_bracketed_str)
+        return text
+
+
+# written with literal prefixes instead of {2,} counts, which the regex engine searches for faster
+_INLINE_TOKEN_REGEX = re.compile(r"''+|\[\[+|\]\]+|\{\{+|\}\}+|</ref>|</code>|<ref|<code|/>")
+
+# bold and italic content is wrapped as is: the quotes stripped by _format_bold() and _format_italic()
+# are only the brackets themselves, as the content can't start or end with a quote before it's formatted
+_INLINE_QUOTE_FORMATS = {
+        "'''": ("\x1b[1m", "\x1b[22m"),
+        "''": ("\x1b[3m", "\x1b[23m"),
+}
+_INLINE_CLOSING = { "]]": "[[", "}}": "{{" }
+_INLINE_FORMAT_FUNCS = {
+        "[[": _format_link,
+        "{{": format_curly_bracketed_str,
+}
+
+# characters that could form a new bracket if the text between them is removed
+_JOINING_LEFT_CHARS = "'[]{}</"
+_JOINING_RIGHT_CHARS = "'[]{}/>rc"
+
+def _format_inline_single_pass(text: str) -> str | None:
+        """Formats bold, italic, refs, code, links and templates in 'text' in a single pass.
+
+        Output is the same as _format_inline_by_passes() output. Returns None if it can't be guaranteed to be,
+        i.e. when the passes would interact: templates inside links, brackets crossing each other, unclosed brackets,
+        or refs and code tags that the passes would pair differently than the tags are written.
+
+        Templates nested in templates, and links nested in links, are formatted the way the passes format them:
+        the nested ones first, and then the enclosing one from its text before the nested ones were formatted.
+        Its formatted text replaces the part of it after the last nested one.
+        """
+        start_time = time()
+
+        # stack of brackets that are open, their formatted content so far,
+        # their content as it was before their own kind of brackets were formatted,
+        # and where in the formatted content the last nested bracket of the same kind ends
+        open_kinds = [None]
+        buffers = [[]]
+        raws = [[]]
+        nested_ends = [None]
+
+        # a "/>" not belonging to a self-closing tag stops the matching of later self-closing <ref/> or <code/> tags
+        ref_tags_blocked = False
+        code_tags_blocked = False
+
+        last_removed_end = -1
+        last_removed_left_char = ""
+
+        pos = 0
+        while True:
+                m = _INLINE_TOKEN_REGEX.search(text, pos)
+                if not m:
+                        break
+
+                token = m.group()
+                start, end = m.span()
+                buffers[-1].append(text[pos : start])
+                raws[-1].append(text[pos : start])
+                pos = end
+
+                if token[0] == "'":
+                        if len(token) > 3:
+                                return None
+                        if open_kinds[-1] == token:
+                                content = "".join(buffers.pop())
+                                raw = "".join(raws.pop())
+                                open_kinds.pop()
+                                nested_ends.pop()
+                                prefix, suffix = _INLINE_QUOTE_FORMATS[token]
+                                buffers[-1].append(prefix + content + suffix)
+                                raws[-1].append(prefix + raw + suffix)
+                                continue
+                        if token in open_kinds:
+                                return None
+                        open_kinds.append(token)
+                        buffers.append([])
+                        raws.append([])
+                        nested_ends.append(None)
+
+                elif token[0] in "[{]}":
+                        # a run of brackets is read as pairs of them, as the passes do; an odd one out can't be paired the same way
+                        if len(token) % 2:
+                                return None
+
+                        bracket = token[ : 2]
+                        for _ in range(len(token) // 2):
+                                if bracket in ("[[", "{{"):
+                                        if "[[" in open_kinds and (bracket == "{{" or open_kinds[-1] != "[["):
+                                                return None
+                                        if bracket in open_kinds and open_kinds[-1] != bracket:
+                                                return None
+                                        open_kinds.append(bracket)
+                                        buffers.append([])
+                                        raws.append([])
+                                        nested_ends.append(None)
+                                        continue
+
+                                opening = _INLINE_CLOSING[bracket]
+                                if open_kinds[-1] != opening:
+                                        return None
+                                content = buffers.pop()
+                                bracketed_str = opening + "".join(raws.pop()) + bracket
+                                nested_end = nested_ends.pop()
+                                open_kinds.pop()
+
+                                formatted_str = _INLINE_FORMAT_FUNCS[opening](bracketed_str)
+                                if nested_end is not None:
+                                        formatted_str = opening + "".join(content[ : nested_end]) + formatted_str
+
+                                buffers[-1].append(formatted_str)
+                                if open_kinds[-1] == opening:
+                                        raws[-1].append(bracketed_str)
+                                        nested_ends[-1] = len(buffers[-1])
+                                else:
+                                        # links are formatted before templates, so a template's text has them formatted
+                                        raws[-1].append(formatted_str if opening == "[[" else bracketed_str)
+
+                elif token == "/>":
+                        ref_tags_blocked = True
+                        code_tags_blocked = True
+                        buffers[-1].append(token)
+                        raws[-1].append(token)
+
+                elif token in ("<ref", "<code"):
+                        tag_end = text.find(">", end)
+                        if tag_end == -1:
+                                return None
+
+                        if text[tag_end - 1] == "/":
+                                if token == "<ref" and ref_tags_blocked or token == "<code" and code_tags_blocked:
+                                        return None
+                                if token == "<code":
+                                        ref_tags_blocked = True
+                                content = text[end : tag_end - 1]
+                                removed_end = tag_end + 1
+                        else:
+                                closing = "</" + token[1:] + ">"
+                                closing_start = text.find(closing, tag_end)
+                                if closing_start == -1:
+                                        return None
+                                content = text[end : closing_start]
+                                removed_end = closing_start + len(closing)
+                                if token == "<code" and "/>" in content:
+                                        ref_tags_blocked = True
+
+                        for s in ("<ref", "<code", "</ref>", "</code>", "'''"):
+                                if s in content:
+                                        return None
+
+                        left_char = last_removed_left_char if start == last_removed_end else text[start - 1 : start]
+                        right_char = text[removed_end : removed_end + 1]
+                        if left_char and right_char and left_char in _JOINING_LEFT_CHARS and right_char in _JOINING_RIGHT_CHARS:
+                                return None
+
+                        last_removed_end = removed_end
+                        last_removed_left_char = left_char
+                        pos = removed_end
+
+                else: # closing tags without opening tags
+                        return None
+
+        if len(open_kinds) > 1:
+                return None
+        buffers[-1].append(text[pos : ])
+
+        log("single pass formatting took:", time() - start_time, "seconds")
+        return "".join(buffers[-1])
+
+
+def _format_inline(text: str) -> str:
+        """Formats bold, italic, refs, code, links and templates in 'text'.
+
+        The whole text is formatted in a single pass if it can be. Otherwise it's formatted a line at a time,
+        and only the lines that can't be formatted in a single pass are formatted by passes.
+        """
+        formatted_text = _format_inline_single_pass(text)
+        if formatted_text is not None:
+                return formatted_text
+
+        log("Formatting section line by line.")
+        formatted_lines = []
+        for line in text.split("\n"):
+                formatted_line = _format_inline_single_pass(line)
+                if formatted_line is None:
+                        formatted_line = _format_inline_by_passes(line)
+                formatted_lines.append(formatted_line)
+        return "\n".join(formatted_lines)
+
+
+_INDENT_STR = "\x1b[2m" + "▏   " + "\x1b[0m"
+
+def _render_nodes(nodes: list[wikitree.Node], rendered_lines: list[str]) -> None:
+        """Render definitions, examples and other lines of a section's tree, definitions numbered and indented by their depth.
+        Quotations are left out, and examples too in compact output.
+        """
+        number = 0
+        for node in nodes:
+                if node.kind == wikitree.QUOTATION or node.kind == wikitree.QUOTATION_TEXT:
+                        continue
+                if node.kind == wikitree.EXAMPLE and options.COMPACT:
+                        continue
+
+                text = _format_inline(node.text).strip()
+                if node.kind == wikitree.DEFINITION:
+                        number += 1
+                        rendered_lines.append((node.depth - 1) * _INDENT_STR + str(number) + ". " + text)
+                        _render_nodes(node.children, rendered_lines)
+                elif node.kind == wikitree.EXAMPLE:
+                        rendered_lines.append(node.depth * _INDENT_STR + "\x1b[31m" + text + "\x1b[39m")
+                else:
+                        rendered_lines.append(text)
 
 
 def format_section_content(section: Section, lang: str) -> str:
         """ Returns the text content of a section formatted into a nicer format.
+
+        The content is rendered from the section's tree, a line per node. The formatted content is saved into the tree,
+        and reused when the section is formatted again.
         """
-        sect_text = section.content
-        sect_text = _join_multiline_brackets(sect_text)
-        # add section header
-        sect_text = ("===" + "\x1b[1;34m" + section.title + "\x1b[22;39m" + "===" + '\n') + sect_text
-
-        sect_text = format_all_brackets(sect_text, "'''", "'''",
-                lambda s: "\x1b[1m" + s.strip("'") + "\x1b[22m" )
-        sect_text = format_all_brackets(sect_text, "<ref", "</ref>",
-                lambda s: "" )
-        sect_text = format_all_brackets(sect_text, "<ref", "/>",
-                lambda s: "" )
-        sect_text = format_all_brackets(sect_text, "<code", "</code>",
-                lambda s: "" )
-        sect_text = format_all_brackets(sect_text, "<code", "/>",
-                lambda s: "" )
-        sect_text = format_all_brackets(sect_text, "''", "''",
-                lambda s: "\x1b[3m" + s.strip("'") + "\x1b[23m" )
-        sect_text =  format_all_brackets(sect_text, "[[", "]]",
-                lambda s: "\x1b[35m" + s.strip("[]").replace(" ", "·") + "\x1b[39m" )
-        sect_text = format_all_brackets(sect_text, "{{", "}}",
-                format_curly_bracketed_str)
-
-        sect_text = format_indents(sect_text)
+        tree = section.tree
+        key = ("ansi", section.title, options.COMPACT)
+        if key in tree.formatted:
+                return tree.formatted[key]
+
+        rendered_lines = ["\x1b[1;34m" + _format_inline(section.title) + "\x1b[22;39m"]
+        _render_nodes(tree.children, rendered_lines)
+        sect_text = "\n".join(rendered_lines)
+        tree.formatted[key] = sect_text
 
         return sect_text
@@ -1,62 +1,145 @@
 import re
+from array import array
+from functools import lru_cache, partial
 import tools.languages as languages
+import tools.wikitree as wikitree
 from tools.logger import log
 from tools.config import PATH_SEP
 
+_HEADING_REGEX = re.compile("^=+" + "[^=]+" + "=+$", re.MULTILINE)
+
+def _strip_span(text: str, start: int, end: int) -> tuple[int, int]:
+        """ Return the span of text[start : end].strip() in text.
+        """
+        while start < end and text[start].isspace():
+                start += 1
+        while end > start and text[end - 1].isspace():
+                end -= 1
+        return start, end
+
 class Section:
-        def __init__(self, title: str, content: str, children: list=[], number:int=None) -> 'Section':
+        __slots__ = ("__children", "__content", "__text", "__spans", "__depth", "__title", "__number", "__index",
+                     "__tree", "__page_index", "__parent", "__loader")
+
+        def __init__(self, title: str, content: str, children: list=[], number:int=None, index:int=None, loader: callable=None,
+                     text: str=None, spans: array=None) -> 'Section':
+                """ Instead of a content string, the section's content can be given as a span of a text, e.g. the section's page's text.
+                Spans is an array of the start and end positions of the contents of the page's sections, indexed by section index,
+                so that section i's content is text[spans[2*i] : spans[2*i + 1]].
+                The content is then sliced from the text when it's used, so that a page's text isn't held in memory twice.
+
+                If a loader is given, it's called with the section when the section's content or children are first needed.
+                The loader adds the section's children and sets the spans of their and the section's contents.
+                """
                 self.__children = children
                 self.__content = content
+                self.__text = text
+                self.__spans = spans
                 self.__depth = int(title.count("=") / 2)
                 self.__title = title.replace("=","").replace("}","").replace("{","").strip()
                 self.__number = number
+                self.__index = index
+                self.__tree = None
+                self.__page_index = None
+                self.__parent = None
+                self.__loader = loader
 
         @property
         def title(self) -> str:
                 return self.__title
         @property
         def children(self) -> list['Section']:
+                if self.__loader is not None:
+                        self.__load()
                 return self.__children
         @property
         def depth(self) -> int:
                 return self.__depth
         @property
         def content(self) -> str:
+                if self.__loader is not None:
+                        self.__load()
+                if self.__content is None:
+                        i = 2 * self.__index
+                        return self.__text[self.__spans[i] : self.__spans[i + 1]]
                 return self.__content
         @property
+        def span(self) -> tuple[int, int] | None:
+                """ Position of the section's content in its page's text, if the content is stored as a span.
+                """
+                if self.__loader is not None:
+                        self.__load()
+                if self.__content is None:
+                        i = 2 * self.__index
+                        return self.__spans[i], self.__spans[i + 1]
+                return None
+        @property
         def number(self) -> int:
+                """ Position of the section among its siblings, starting from 1.
+                """
                 return self.__number
+        @property
+        def index(self) -> int:
+                """ Position of the section's title among the titles on its page, the page's root section being 0.
+                For titles written as plain "==Title==" lines, this matches the section's index in MediaWiki.
+                """
+                return self.__index
+        @property
+        def tree(self) -> wikitree.SectionTree:
+                """The section's content parsed into definitions, examples, quotations etc.
+                Parsed when first needed, and then shared by everything rendering the section.
+                """
+                if self.__tree is None:
+                        self.__tree = wikitree.parse(self.content)
+                return self.__tree
+        @property
+        def parent(self) -> 'Section':
+                return self.__parent
+
+        @property
+        def page_index(self) -> 'SectionIndex':
+                """ Lookup tables of the page this section is on, if they've been built.
+                """
+                return self.__page_index
 
         @children.setter
         def children(self, children):
                 self.__children =  children
         @title.setter
         def title(self, title):
+                old_title = self.__title
                 self.__title = title
+                if self.__page_index is not None:
+                        self.__page_index.retitle(self, old_title)
+        @page_index.setter
+        def page_index(self, page_index: 'SectionIndex'):
+                self.__page_index = page_index
 
         def add_child(self, child: 'Section') -> None:
-                self.__children.append(child)
+                self.children.append(child)
+                child.__parent = self
+
+        def __load(self) -> None:
+                loader = self.__loader
+                self.__loader = None
+                loader(self)
 
         def count_children(self):
                 """ Recursively count section's all child sections. (meaning this section excluded)
                 """
-                count = len(self.__children)
-                for child in self.__children:
+                count = len(self.children)
+                for child in self.children:
                         count += child.count_children()
                 return count
 
-        def __all_children(self):
-                """Returns a list of all direct and indirect children"""
-                c = self.__children
-                for dc in self.__children:
-                        c += dc.__all_children()
-                return c
-
         def __get_sections(self, section_title: str) -> list['Section']:
                 """ Return all sections with the given title.
                 Case insensitive.
                 """
                 # TODO add wildcards *
+                if self.__page_index is not None:
+                        return self.__page_index.find(section_title, self)
+
                 matches = []
                 if self.title.lower() == section_title.lower() or str(self.number) == section_title.lower():
                         matches.append(self)
@@ -102,52 +185,168 @@ class Section:
                 else:
                         return None
 
-        def _find_by_path(self, sect_path:str|list, _results:list['Section']=[]):
-                """Return Section(s) to which sect_path points.
-                If path starts with path sep, next sections are strictrly searched from this sections children.
-                If path does not start with path sep, the first subsection match, which may not be a direct child of this section, is used as root.
+        def _find_by_path(self, sect_path:str|list) -> list['Section']:
+                """Return Section(s) to which sect_path points, in the order they are on the page.
+                Path is walked from this section's children. "*" matches any one section and "**" any number of sections (including none).
+                See SectionPath.
                 """
-                # convert str path to list
-                if sect_path.__class__ is str:
-                        sect_path = sect_path.split(PATH_SEP)
-                sect_path = [s.strip().lower() for s in sect_path if s]
-                log(f'remaining path {sect_path}; at "{self.title}"; children: {[ s.title for s in self.__children]}')
+                if sect_path.__class__ is not str:
+                        sect_path = PATH_SEP.join(sect_path)
+                return compile_section_path(sect_path).find_in(self)
 
+        def __str__(self, _relative_depth: int=1):
+                #string = (relative_depth-1) * "\033[2m▏  \033[0m" + self.__title
+                string = (_relative_depth-1) * "#" + self.__title
+                for child in self.children:
+                        string += '\n' + child.__str__(_relative_depth+1)
 
+                return string
 
-                if len(sect_path) == 0:
-                        return [ self ]
 
-                next_sect_search = sect_path[0]
-                next_sects = []
+class SectionPath:
+        """ A compiled PATH_SEP separated path of section titles/numbers, "*"s and "**"s.
 
-                for s in self.children:
-                        if s.title.lower() == next_sect_search or str(s.number) == next_sect_search :
-                                next_sects.append(s)
-                        elif next_sect_search == "*":
-                                next_sects.append(s)
-                        elif next_sect_search == "**":
-                                next_sects.append(s)
-                                next_sects.append(self)
-                                next_sects += s.__all_children()
+        A path is matched against a section tree in one depth first walk, keeping track of how far into the path
+        each section on the way is. The walk doesn't descend into sections that no longer can lead to a match,
+        and doesn't modify the tree.
+        """
+        __slots__ = ("steps",)
 
-                if len(sect_path) >= 1:
-                        new_results = []
-                        for s in next_sects:
-                                new_results += s._find_by_path(sect_path[1:], _results)
-                        _results = list(set(_results + new_results))
+        def __init__(self, steps: tuple[str]) -> 'SectionPath':
+                self.steps = steps
 
-                return _results
+        def __closure(self, positions: set[int]) -> set[int]:
+                """ Add the positions reached by letting "**"s match no sections.
+                """
+                positions = set(positions)
+                unchecked = list(positions)
+                while unchecked:
+                        pos = unchecked.pop()
+                        if pos < len(self.steps) and self.steps[pos] == "**" and pos + 1 not in positions:
+                                positions.add(pos + 1)
+                                unchecked.append(pos + 1)
+                return positions
+
+        def __advance(self, positions: set[int], child: Section) -> set[int]:
+                """ Positions in the path after stepping from a section (at 'positions') to its child.
+                """
+                next_positions = set()
+                for pos in positions:
+                        if pos == len(self.steps):
+                                continue
+                        step = self.steps[pos]
+                        if step == "**":
+                                next_positions.add(pos)
+                        elif step == "*" or child.title.lower() == step or str(child.number) == step:
+                                next_positions.add(pos + 1)
+                return self.__closure(next_positions)
+
+        def find_in(self, section: Section) -> list[Section]:
+                """ Return the sections under 'section' (or 'section' itself) that the path points to, in the order they are on the page.
+                """
+                return list(self.iter_in(section))
+
+        def iter_in(self, section: Section):
+                """ Yield the sections that find_in() returns, each as soon as the walk reaches it.
+                """
+                unvisited = [(section, self.__closure({0}))]
+                while unvisited:
+                        sect, positions = unvisited.pop()
+                        if len(self.steps) in positions:
+                                yield sect
+
+                        for child in reversed(sect.children):
+                                child_positions = self.__advance(positions, child)
+                                if child_positions:
+                                        unvisited.append((child, child_positions))
+
+@lru_cache(maxsize=256)
+def compile_section_path(path: str) -> SectionPath:
+        """ Compile a PATH_SEP separated path into a SectionPath. Compiled paths are reused.
+        Path is case insensitive, and empty parts (e.g. from a leading PATH_SEP) are ignored.
+        """
+        steps = tuple(s.strip().lower() for s in path.split(PATH_SEP) if s)
+        log(f"compiled section path {steps}")
+        return SectionPath(steps)
+
+
+class SectionView:
+        """ A section shown with a different title, without changing the section itself.
+
+        Everything else is the viewed section's.
+        """
+        __slots__ = ("section", "title")
+
+        def __init__(self, section: Section, title: str) -> 'SectionView':
+                self.section = section
+                self.title = title
+
+        def __getattr__(self, name: str):
+                if name == "section":
+                        raise AttributeError(name)
+                return getattr(self.section, name)
 
         def __str__(self, _relative_depth: int=1):
-                #string = (relative_depth-1) * "\033[2m▏  \033[0m" + self.__title
-                string = (_relative_depth-1) * "#" + self.__title
-                for child in self.__children:
+                string = (_relative_depth-1) * "#" + self.title
+                for child in self.section.children:
                         string += '\n' + child.__str__(_relative_depth+1)
 
                 return string
 
 
+class SectionIndex:
+        """ Lookup tables of a page's sections, for finding sections without walking the section tree.
+
+        Sections are looked up by their lowercased title or by their number.
+        Found sections are in the same order as they are on the page.
+        """
+        def __init__(self, root_section: Section) -> 'SectionIndex':
+                self.__root_section = root_section
+                self.__by_title = {}
+                self.__by_number = {}
+
+                unvisited = [root_section]
+                while unvisited:
+                        section = unvisited.pop()
+                        self.__by_title.setdefault(section.title.lower(), []).append(section)
+                        self.__by_number.setdefault(str(section.number), []).append(section)
+                        section.page_index = self
+
+                        unvisited += reversed(section.children)
+
+        def is_within(self, section: Section, ancestor: Section) -> bool:
+                """ Check if section is the ancestor section or one of its direct or indirect children.
+                """
+                if ancestor is self.__root_section:
+                        return True
+
+                while section is not None:
+                        if section is ancestor:
+                                return True
+                        section = section.parent
+                return False
+
+        def find(self, section_title: str, within: Section) -> list[Section]:
+                """ Return all sections with the given title or number, that are the 'within' section or under it.
+                Case insensitive.
+                """
+                key = section_title.lower()
+                matches = self.__by_title.get(key, [])
+                number_matches = self.__by_number.get(key)
+                if number_matches:
+                        matches = sorted(set(matches + number_matches), key=lambda s: s.index)
+
+                return [s for s in matches if self.is_within(s, within)]
+
+        def retitle(self, section: Section, old_title: str) -> None:
+                """ Move a section whose title has changed to its new title's place.
+                """
+                self.__by_title[old_title.lower()].remove(section)
+                matches = self.__by_title.setdefault(section.title.lower(), [])
+                matches.append(section)
+                matches.sort(key=lambda s: s.index)
+
+
 class WikiPage:
         valid_wiki_sites = [
                 "wikipedia",
@@ -159,52 +358,114 @@ class WikiPage:
                 "translations": ["@t", "@translations"],
         }
 
-        def __init__(self, page_text: str, page_title: str, language: str, site) -> 'WikiPage':
+        def __init__(self, page_text: str, page_title: str, language: str, site, lazy: bool=False,
+                     page_id: int=None, rev_id: int=None) -> 'WikiPage':
+                """ If lazy is True, only the language (level 2) sections are split from the page at first,
+                and a language section's content and subsections are parsed when a query first reaches it.
+
+                page_id and rev_id are the wiki's ids of the page and of the revision page_text is from, if known.
+                """
                 if site not in WikiPage.valid_wiki_sites:
                         raise ValueError("Unsupported site")
 
                 self.__text = page_text
                 self.__title = page_title
                 self.__language = language
-                self.__root_section = self.__split_into_sections()
+                self.__spans = None  # start and end positions of the sections' contents, see Section
+                self.__root_section = None
+                if lazy:
+                        self.__root_section = self.__split_into_language_sections()
+                if self.__root_section is None:
+                        self.__root_section = self.__split_into_sections()
                 self.__site = site
+                self.__page_id = page_id
+                self.__rev_id = rev_id
+                self.__section_index = None
 
 
-        def __get_children(self, section_tuples: list, child_depth: int=1, _sect_num:int=1) -> Section:
-                """ Recursively arrange a dictionary of wiki titles and their contents into a parent-child tree.
+        def __build_section_tree(self, root: Section, section_tuples: list, first_index: int=1) -> Section:
+                """ Arrange a list of wiki titles and their contents into a parent-child tree under root.
 
-                Section_tuples is a list of tuples which contain the section title and the text content assosiated with that title.
+                Section_tuples is a list of tuples which contain the section title and the span of the content assosiated with that title in the page's text.
                 eg.
-                sections[0] = ("title","text")
+                sections[0] = ("title", (start, end))
+
+                Done in one pass, keeping a stack of the sections that following sections can be children of.
+                A section is a child of the closest preceding section with a smaller depth (or of the root section).
+                Sections are numbered by their position among their siblings, and indexed by their position in the page,
+                the first one getting first_index.
+                """
+                spans = self.__spans
+                open_sections = [root]
+                for index, (sect_title, sect_span) in enumerate(section_tuples, first_index):
+                        depth = int(sect_title.count("=") / 2)
+
+                        while len(open_sections) > 1 and open_sections[-1].depth >= depth:
+                                open_sections.pop()
+                        parent = open_sections[-1]
+
+                        spans[2 * index], spans[2 * index + 1] = sect_span
+                        section = Section(sect_title, None, [], len(parent.children) + 1, index, text=self.__text, spans=spans)
+                        parent.add_child(section)
+                        open_sections.append(section)
+
+                return root
+
+
+        def __split_into_language_sections(self) -> Section | None:
+                """ Split only the page's language (level 2) sections from the page, leaving their parsing for later.
+
+                Returns None if the page has headings that wouldn't end up under a language section,
+                in which case the page should be parsed fully.
                 """
+                text = self.__text
+                languages_spans = []  # (title_start, title_end, index) of the language sections
+                heading_count = 0
+                for m in _HEADING_REGEX.finditer(text):
+                        heading_count += 1
+                        depth = int(m.group().count("=") / 2)
+                        if depth <= 1 or (heading_count == 1 and depth != 2):
+                                return None
+                        if depth == 2:
+                                languages_spans.append((m.start(), m.end(), heading_count))
+
+                if not languages_spans:
+                        return None
 
-                children = []
-                i = 0
-                while i < len(section_tuples):
-                        sect_title = section_tuples[i][0]
-                        cur_depth = int(sect_title.count("=") / 2)
+                self.__spans = array("i", [0]) * (2 * (heading_count + 1))
+                self.__spans[0], self.__spans[1] = _strip_span(text, 0, languages_spans[0][0])
+                root = Section("=" + self.__title + "=", None, [], 1, 0, text=text, spans=self.__spans)
+                for i, (title_start, title_end, index) in enumerate(languages_spans):
+                        end = languages_spans[i + 1][0] if i + 1 < len(languages_spans) else len(text)
+                        loader = partial(self._load_language_section, title_end, end, index)
+                        root.add_child(Section(text[title_start : title_end].strip(), None, [], i + 1, index, loader, text=text, spans=self.__spans))
 
-                        if cur_depth == child_depth:
-                                child_sect = Section(sect_title, section_tuples[i][1], [], _sect_num)
-                                section_tuples.pop(0)
-                                child_children = self.__get_children(section_tuples, child_depth+1)
-                                child_sect.children = child_children
-                                children.append(child_sect)
-                                i-=1
+                return root
 
-                        elif cur_depth == child_depth - 1:
-                                break
+        def _load_language_section(self, start: int, end: int, index: int, section: Section) -> None:
+                """ Parse the language section at index, and its subsections, from text[start : end].
+                """
+                text = self.__text
+                title_spans = [m.span() for m in _HEADING_REGEX.finditer(text, start, end)]
 
-                        _sect_num += 1
-                        i+=1
+                def content_span(content_start: int, content_end: int) -> tuple[int, int]:
+                        # the page's last section's content is not stripped
+                        if content_end == len(text):
+                                return content_start, content_end
+                        return _strip_span(text, content_start, content_end)
 
-                return children
+                section_tuples = []
+                for s_i, (title_start, title_end) in enumerate(title_spans):
+                        content_end = title_spans[s_i + 1][0] if s_i + 1 < len(title_spans) else end
+                        section_tuples.append( (text[title_start : title_end].strip(), content_span(title_end, content_end)) )
 
+                self.__spans[2 * index], self.__spans[2 * index + 1] = content_span(start, title_spans[0][0] if title_spans else end)
+                self.__build_section_tree(section, section_tuples, index + 1)
 
         def __split_into_sections(self) -> Section:
                 """ Parse wiki page's content into a section object
                 """
-                title_matches = list(re.finditer("^=+" + "[^=]+" + "=+$", self.__text, re.MULTILINE))
+                title_matches = list(_HEADING_REGEX.finditer(self.__text))
 
                 # get the starting and ending positions for each title
                 section_spans = [(0,0)]
@@ -225,19 +486,21 @@ class WikiPage:
 
                         # if at last title, where no next title to stop at:
                         if s_i + 1 >= len(section_spans):
-                                section_content = self.__text[start : ]
+                                content_span = (start, len(self.__text))
 
                         # otherwise use the next title's beginning as stop:
                         else:
                                 end = section_spans[s_i + 1][0]
-                                section_content = self.__text[start : end].strip()
+                                content_span = _strip_span(self.__text, start, end)
 
-                        sections.append( (section_title, section_content) )
+                        sections.append( (section_title, content_span) )
 
                 # Arrange titles into a parent-child tree
-                page_root_section = self.__get_children(sections)
-
-                return page_root_section[0]
+                self.__spans = array("i", [0]) * (2 * len(sections))
+                root_title, root_span = sections[0]
+                self.__spans[0], self.__spans[1] = root_span
+                root = Section(root_title, None, [], 1, 0, text=self.__text, spans=self.__spans)
+                return self.__build_section_tree(root, sections[1:])
 
         def find_page_sections(self, search: str) -> list[Section] | None:
                 """Find sections from this page.
@@ -246,33 +509,61 @@ class WikiPage:
 
                 Search can either be a path to a section, a section name, or a keyword that matches a group of sections, e.g. 'definitions' for wiktionary pages, which matches Noun, Verb, etc.. sections
                 """
+                return list(self.iter_page_sections(search))
 
-                root_section = self.__root_section
+        def iter_page_sections(self, search: str):
+                """Yield the sections that find_page_sections() returns.
 
-                matching_sections = []
+                Sections matching a path are yielded as soon as they're found, so that they can be shown before the rest of the page has been searched.
+                """
+                root_section = self.__root_section
 
                 if search.lower() in self.search_keywords["definitions"]:
-                        for wc in languages.definitions[self.__language]:
-                                path_to_def = f"{languages.abbrev_table[self.__language][self.__language]}{PATH_SEP}**{PATH_SEP}{wc}"
-                                results = root_section.find(path_to_def)
-                                if results:
-                                        matching_sections += results
+                        for wc, sect in self.__find_word_class_sections():
+                                yield sect
 
                 elif search.lower() in self.search_keywords["translations"]:
-                        for wc in languages.definitions[self.__language]:
-                                path_to_tr = f"{languages.abbrev_table[self.__language][self.__language]}{PATH_SEP}**{PATH_SEP}{wc}{PATH_SEP}{languages.translations[self.__language]}"
-                                results = root_section.find(path_to_tr)
-                                if results:
-                                        for r in results:
-                                            r.title += " " + "(" + wc + ")"
-                                        matching_sections += (results)
+                        translations_title = languages.translations[self.__language].lower()
+                        for wc, sect in self.__find_word_class_sections():
+                                for c in sect.children:
+                                        if c.title.lower() == translations_title:
+                                                yield SectionView(c, c.title + " " + "(" + wc + ")")
 
                 else:
-                        results = root_section.find(search)
-                        if results:
-                                matching_sections += results
+                        # Same as root_section.find(search), but only building the lookup tables
+                        # (and parsing all of a lazily parsed page) if the search isn't a path on the page.
+                        found = False
+                        for sect in compile_section_path(search).iter_in(root_section):
+                                found = True
+                                yield sect
+                        if not found:
+                                yield from self.section_index.find(search, root_section)
+
+        def __find_word_class_sections(self) -> list[tuple[str, Section]]:
+                """ Find the word class sections (Noun, Verb etc.) under the page language's section, in one walk of the language's section tree.
+
+                Returns a list of tuples of word class and section, ordered by the word classes' order in languages.definitions.
+                """
+                word_classes = languages.definitions[self.__language]
+                word_class_titles = languages.definition_titles[self.__language]
+                language_title = languages.abbrev_table[self.__language][self.__language].lower()
 
-                return matching_sections
+                matches = []
+                for lang_sect in self.__root_section.children:
+                        if lang_sect.title.lower() != language_title and str(lang_sect.number) != language_title:
+                                continue
+
+                        unvisited = list(reversed(lang_sect.children))
+                        while unvisited:
+                                sect = unvisited.pop()
+                                if sect.title.lower() in word_class_titles:
+                                        matches.append(sect)
+                                unvisited += reversed(sect.children)
+
+                ordered = []
+                for wc in word_classes:
+                        ordered += [(wc, sect) for sect in matches if sect.title.lower() == wc.lower()]
+                return ordered
 
         def __str__(self):
                 def add_sect_content(sect: Section) -> str:
@@ -292,6 +583,27 @@ class WikiPage:
         def root_section(self) -> Section:
                 return self.__root_section
         @property
+        def section_index(self) -> SectionIndex:
+                """ Lookup tables of the page's sections, built when first needed.
+                """
+                if self.__section_index is None:
+                        self.__section_index = SectionIndex(self.__root_section)
+                return self.__section_index
+        def language_spans(self) -> list[tuple[str, int, int]]:
+                """ Return the title, and the start and end positions in the page's text, of each language (level 2) section.
+                A language section's span starts from its heading and ends where the next language section begins.
+                """
+                spans = []
+                for m in _HEADING_REGEX.finditer(self.__text):
+                        if int(m.group().count("=") / 2) != 2:
+                                continue
+                        if spans:
+                                spans[-1][2] = m.start()
+                        spans.append([m.group().replace("=","").replace("}","").replace("{","").strip(), m.start(), len(self.__text)])
+
+                return [tuple(s) for s in spans]
+
+        @property
         def text(self) -> str:
                 return self.__text
         @property
@@ -303,3 +615,9 @@ class WikiPage:
         @property
         def site(self) -> str:
                 return self.__site
+        @property
+        def page_id(self) -> int | None:
+                return self.__page_id
+        @property
+        def rev_id(self) -> int | None:
+                return self.__rev_id
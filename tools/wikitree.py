@@ -0,0 +1,203 @@
+import re
+
+# Kinds of lines in a section's content
+DEFINITION = "definition"          # '#' -lines, and '##' -lines for sub definitions
+EXAMPLE = "example"                # '#:' -lines
+QUOTATION = "quotation"            # '#*' -lines (quotation title/source)
+QUOTATION_TEXT = "quotation text"  # '#*:' -lines (quotation itself)
+TEXT = "text"                      # lines not starting with '#'
+
+_INLINE_BRACKET_REGEX = re.compile(r"\{\{|\}\}|\[\[|\]\]")
+_LINE_PREFIX_REGEX = re.compile(r"^(#+)(\*:|:|\*)?")
+
+class Template:
+        """A '{{name|param|...}}' template in a line."""
+        __slots__ = ("name", "params")
+
+        def __init__(self, name: str, params: list[str]) -> 'Template':
+                self.name = name
+                self.params = params
+
+        def positional_params(self) -> list[str]:
+                """Return the params that are not named (i.e. don't contain '=')."""
+                return [p for p in self.params if "=" not in p]
+
+        def named_param(self, name: str) -> str | None:
+                """Return the value of a 'name=value' param, or None if the template doesn't have one."""
+                for p in self.params:
+                        if p.startswith(name + "="):
+                                return p.removeprefix(name + "=")
+                return None
+
+        def __repr__(self) -> str:
+                return f"Template({self.name!r}, {self.params!r})"
+
+
+class Link:
+        """A '[[target|label]]' link in a line."""
+        __slots__ = ("target", "label")
+
+        def __init__(self, target: str, label: str | None=None) -> 'Link':
+                self.target = target
+                self.label = label
+
+        def __repr__(self) -> str:
+                return f"Link({self.target!r}, {self.label!r})"
+
+
+class Node:
+        """A line in a section's content, and the lines under it.
+
+        e.g. a definition's children are its sub definitions, examples and quotations.
+        Templates and links of the line are parsed when first needed.
+        """
+        __slots__ = ("kind", "depth", "text", "children", "__templates", "__links")
+
+        def __init__(self, kind: str, depth: int, text: str) -> 'Node':
+                self.kind = kind
+                self.depth = depth
+                self.text = text
+                self.children = []
+                self.__templates = None
+                self.__links = None
+
+        @property
+        def templates(self) -> list[Template]:
+                if self.__templates is None:
+                        self.__parse_inline()
+                return self.__templates
+        @property
+        def links(self) -> list[Link]:
+                if self.__links is None:
+                        self.__parse_inline()
+                return self.__links
+
+        def __parse_inline(self) -> None:
+                """Parse templates and links (including nested ones) of the line, in the order they are opened."""
+                templates = []
+                links = []
+                opened = []
+                for m in _INLINE_BRACKET_REGEX.finditer(self.text):
+                        bracket = m.group()
+                        if bracket in ("{{", "[["):
+                                opened.append((bracket, m.end(), len(templates) if bracket == "{{" else len(links)))
+                                # reserve the place, so that nested templates/links come after the ones enclosing them
+                                (templates if bracket == "{{" else links).append(None)
+                                continue
+
+                        opening = "{{" if bracket == "}}" else "[["
+                        while opened and opened[-1][0] != opening:
+                                opened.pop()
+                        if not opened:
+                                continue
+                        _, start, i = opened.pop()
+                        parts = _split_params(self.text[start : m.start()])
+                        if opening == "{{":
+                                templates[i] = Template(parts[0].strip(), parts[1:])
+                        else:
+                                links[i] = Link(parts[0].strip(), parts[1] if len(parts) > 1 else None)
+
+                self.__templates = [t for t in templates if t is not None]
+                self.__links = [l for l in links if l is not None]
+
+        def walk(self):
+                """Yield this node's all direct and indirect children, in the order they are in the text."""
+                for c in self.children:
+                        yield c
+                        yield from c.walk()
+
+        def __repr__(self) -> str:
+                return f"Node({self.kind!r}, {self.depth}, {self.text!r})"
+
+
+class SectionTree(Node):
+        """The parsed content of a section.
+
+        'formatted' is for renderers to save their output into, so that a section is formatted only once.
+        """
+        __slots__ = ("formatted",)
+
+        def __init__(self) -> 'SectionTree':
+                super().__init__(TEXT, 0, "")
+                self.formatted = {}
+
+        def templates_named(self, *names: str) -> list[Template]:
+                return [t for n in self.walk() for t in n.templates if t.name in names]
+
+        def all_links(self) -> list[Link]:
+                return [l for n in self.walk() for l in n.links]
+
+
+def _split_params(text: str) -> list[str]:
+        """Split a template's or link's content on the '|'s that are not inside nested templates or links."""
+        params = []
+        depth = 0
+        left_at = 0
+        for m in re.finditer(r"\{\{|\}\}|\[\[|\]\]|\|", text):
+                s = m.group()
+                if s in ("{{", "[["):
+                        depth += 1
+                elif s in ("}}", "]]"):
+                        depth = max(depth - 1, 0)
+                elif depth == 0:
+                        params.append(text[left_at : m.start()])
+                        left_at = m.end()
+        params.append(text[left_at : ])
+        return params
+
+
+def join_multiline_brackets(text:str) -> str:
+        """Returns a copy of 'text' where brackets that span over multiple lines are joined onto the same line.
+        Joins lines beginning with "|" together with their preceding lines.
+        """
+        joined_lines = []
+        lines = text.splitlines()
+        for line_i in range(len(lines)):
+                line = lines[line_i]
+                if line.startswith("|"):
+                        prev_line = joined_lines.pop()
+                        joined_line = prev_line + line
+                        joined_lines.append(joined_line)
+                else:
+                        joined_lines.append(line)
+
+        return '\n'.join(joined_lines)
+
+
+def parse(content: str) -> SectionTree:
+        """Parse a section's content into a tree of definitions, examples and quotations.
+
+        Sub definitions are children of their definitions, examples and quotations children of the definitions they follow,
+        and quotation texts children of their quotations. Lines that are not definitions are children of the root.
+        """
+        source = join_multiline_brackets(content)
+        tree = SectionTree()
+
+        definitions = [tree] # the definitions that the next lines can belong to, deepest last
+        for line in source.splitlines():
+                line = line.strip()
+                m = _LINE_PREFIX_REGEX.match(line)
+                if not m:
+                        tree.children.append(Node(TEXT, 0, line))
+                        continue
+
+                depth = len(m.group(1))
+                marker = m.group(2)
+                text = line[m.end() : ].strip()
+
+                if marker is None:
+                        node = Node(DEFINITION, depth, text)
+                        while definitions[-1].depth >= depth:
+                                definitions.pop()
+                        parent = definitions[-1]
+                        definitions.append(node)
+                else:
+                        kind = { ":": EXAMPLE, "*": QUOTATION, "*:": QUOTATION_TEXT }[marker]
+                        node = Node(kind, depth, text)
+                        parent = next(d for d in reversed(definitions) if d.depth <= depth)
+                        if kind == QUOTATION_TEXT and parent.children and parent.children[-1].kind == QUOTATION:
+                                parent = parent.children[-1]
+
+                parent.children.append(node)
+
+        return tree
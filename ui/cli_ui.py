@@ -1,3 +1,6 @@
+import os
+import sys
+from itertools import chain
 import tools.languages as languages
 from tools.wikiparser import WikiPage, Section
 import tools.parsing_utils as parsing
@@ -10,6 +13,10 @@ def not_found(word: str, search_lang: str) -> None:
         print(f"Cannot find an entry for '{word}' in {languages.abbrev_table['en'][search_lang]}.")
         return None
 
+def fetch_failed(word: str, site: str) -> None:
+        print(f"Couldn't get the page for '{word}' from {site}, try again later.")
+        return None
+
 def print_supported_languages() -> None:
         print("Supported languages: ")
         for l in languages.supported:
@@ -46,6 +53,8 @@ def print_help_msg() -> None:
         print("Usage:")
         print(f"  wiktionary {dict_commands} <language> <title> [<section-path>|<keyword>]")
         print(f"  wiktionary {article_commands} <from-language> <to-language> <word>")
+        print(f"  wiktionary {dict_commands}|{article_commands} <language> <file>|- -b")
+        print(f"  wiktionary {dict_commands}|{article_commands} <language> <dump-file> [<language-section>] -i")
         print()
         print_options()
         print()
@@ -56,6 +65,26 @@ def print_help_msg() -> None:
         print_path_explanation()
         return None
 
+def print_progress(done: int, total: int) -> None:
+        """Show how many of total items are done, on one line of stderr that is rewritten on each call.
+        Shown only if stderr is a terminal.
+        """
+        if not sys.stderr.isatty():
+                return None
+        end = "\n" if done == total else ""
+        print(f"\r{done}/{total}", end=end, file=sys.stderr, flush=True)
+        return None
+
+def print_import_progress(stats, done: bool=False) -> None:
+        """Show how many pages of a dump have been read and how fast, on stderr.
+        """
+        line = f"{stats.pages_read} pages read, {stats.pages_kept} kept, {stats.pages_per_second:.0f} pages/s, {stats.megabytes_per_second:.2f} MB/s"
+        if sys.stderr.isatty():
+                print("\r" + line, end="\n" if done else "", file=sys.stderr, flush=True)
+        elif done:
+                print(line, file=sys.stderr)
+        return None
+
 def print_saved_searches(searches:list[tuple]|None) -> int:
         """Print searches that are saved into the database
         """
@@ -85,6 +114,20 @@ def print_saved_searches(searches:list[tuple]|None) -> int:
 
         return 0
 
+def print_cache_stats(stats: list[tuple]) -> int:
+        """Print hit and miss counts of the local database's caches
+        """
+        if not stats:
+                print("No cache lookups.")
+                return 1
+
+        for cache, hits, misses in stats:
+                lookups = hits + misses
+                hit_rate = hits / lookups * 100 if lookups else 0
+                print(f"{cache}: {hits} hits, {misses} misses ({hit_rate:.1f}% hit rate)")
+
+        return 0
+
 def print_saved_pages(pages:list[tuple]) -> int:
         """Print pages that are saved into the local database
         """
@@ -114,59 +157,76 @@ def print_sections(page: WikiPage, path:str|None):
         # Only print page structure (__str__ of page's root section) when no path given
         if not path:
                 if not options.DO_FORMATTING:
-                        print(page.root_section)
-                        return 0
+                        return _write_output([page.root_section.__str__() + "\n"])
 
                 text = page.root_section.__str__()
-                print(parsing.format_indents(text))
-                return 0
+                return _write_output([parsing.format_indents(text) + "\n"])
 
-        matching_sects = page.find_page_sections(path)
+        matching_sects = page.iter_page_sections(path)
+        first_sect = next(matching_sects, None)
 
-        if not matching_sects:
+        if first_sect is None:
                 print(f"No matching sections for \"{path}\"")
                 return 1
 
+        return _write_output(render_sections(page, path, chain([first_sect], matching_sects)))
+
+def render_sections(page: WikiPage, path: str, sects):
+        """ Yield the output of a path's matching sections one section at a time,
+        formatting (and finding) the next section only when the previous one has been written.
+        """
         # path starting with PATH_SEP means path from root.
         # when path ends in PATH_SEP, print matching sections' subsection structures.
         # A path consisting of a single PATH_SEP is considered to not 'end' in PATH_SEP, i.e. prints root section's contents.
         # A path consisting of a Two PATH_SEPs is considered to 'end' in PATH_SEP, i.e. prints root section's structure.
         if path.endswith(config.PATH_SEP) and len(path) > 1:
-                for s in matching_sects:
+                for s in sects:
                         text = s.__str__()
                         if options.DO_FORMATTING:
-                                print(parsing.format_indents(text))
+                                yield parsing.format_indents(text) + "\n"
                         else:
-                                print(text)
-                return 0
+                                yield text + "\n"
+                return
 
-        for sect in matching_sects:
+        for sect in sects:
                 if options.DO_FORMATTING:
                         sect_str = parsing.format_section_content(sect, page.language)
                 else:
                         sect_str = sect.content
 
-                print(sect_str + '\n\n' if sect_str is not None else "None", end="")
+                yield sect_str + '\n\n' if sect_str is not None else "None"
 
+def _write_output(chunks) -> int:
+        """ Write output to stdout as it's produced, flushing after each chunk so that it reaches a pipe (e.g. less or head) right away.
+        Stops producing output if the reader has closed stdout.
+        """
+        try:
+                for chunk in chunks:
+                        sys.stdout.write(chunk)
+                        sys.stdout.flush()
+        except BrokenPipeError:
+                # The reader is gone: point stdout to devnull so that flushing it at exit doesn't fail again
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
         return 0
 
-# move section parsing elsewhere and add printing here.
 def print_translations(sections: list[Section], target_lang: str) -> dict:
         translations = {}
         for s in sections:
 
-                lines = s.content.splitlines()
                 cur_tr_top = ""
-                for l in lines:
-                        if l.strip().startswith("{{trans-top"):
-                                cur_tr_top = l
+                for node in s.tree.children:
+                        # name of the template the line starts with. Matched by prefix, so that variants like trans-top-also match too
+                        name = node.templates[0].name if node.text.startswith("{{") and node.templates else ""
+                        if name.startswith("trans-top"):
+                                cur_tr_top = node.text
                                 translations[cur_tr_top] = []
                                 continue
-                        elif l.strip().startswith("{{trans-bottom"):
+                        elif name.startswith("trans-bottom"):
                                 cur_tr_top = ""
                                 continue
-                        elif l.strip(" *").startswith(target_lang):
-                                translations[cur_tr_top].append(l)
+                        elif node.text.strip(" *").startswith(target_lang):
+                                translations[cur_tr_top].append(node.text)
 
         return translations
 